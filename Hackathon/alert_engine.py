@@ -0,0 +1,110 @@
+"""
+Incremental price-alert matching, driven by price writes.
+Exports:
+ - AlertIndex -> in-memory alert thresholds per product, kept sorted for bisect lookups
+ - evaluate_alerts(cur, changes, index=None) -> records alerts crossed by changed prices
+
+An alert fires for a listing when its price moves from above the threshold
+to at or below it (or first appears at or below it). Each firing is stored
+in alert_triggers, so the cost of a check is proportional to the number of
+prices that changed, not to the number of alerts.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+# the index only picks up new alerts incrementally; a periodic full reload drops deleted ones
+ALERT_INDEX_RELOAD_SECONDS = float(os.environ.get("ALERT_INDEX_RELOAD_SECONDS", "3600"))
+
+
+class AlertIndex:
+    """Alerts grouped by product as sorted (threshold, alert_id, user_id) lists."""
+
+    def __init__(self, reload_seconds=ALERT_INDEX_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self.by_product = {}
+        self.last_alert_id = 0
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def sync(self, cur):
+        """Load alerts created since the last sync (or everything, when a reload is due)."""
+        with self.lock:
+            full = self.loaded_at is None or time.monotonic() - self.loaded_at > self.reload_seconds
+            if full:
+                cur.execute("SELECT alert_id, user_id_reference, product_id_reference, price_alert FROM alerts")
+                self.by_product = {}
+                self.last_alert_id = 0
+                self.loaded_at = time.monotonic()
+            else:
+                cur.execute("""
+                    SELECT alert_id, user_id_reference, product_id_reference, price_alert
+                    FROM alerts WHERE alert_id > %s
+                """, (self.last_alert_id,))
+            for alert_id, user_id, product_id, threshold in cur.fetchall():
+                insort(self.by_product.setdefault(product_id, []), (float(threshold), alert_id, user_id))
+                self.last_alert_id = max(self.last_alert_id, alert_id)
+
+    def crossed(self, product_id, old_price, new_price):
+        """Alerts on product_id with new_price <= threshold < old_price."""
+        entries = self.by_product.get(product_id)
+        if not entries or new_price is None:
+            return []
+        lo = bisect_left(entries, (new_price,))
+        hi = len(entries) if old_price is None else bisect_left(entries, (old_price,))
+        return entries[lo:hi]
+
+    def __len__(self):
+        return sum(len(v) for v in self.by_product.values())
+
+
+def evaluate_alerts(cur, changes, index=None):
+    """Record every alert crossed by `changes` ((product_id, vendor_id, old_price, new_price) tuples).
+
+    Long-running processes (the price updater) pass an AlertIndex; one-off
+    writes from the web app leave it out and match with an index-backed query
+    on alerts (product_id_reference, price_alert) instead. Returns the number
+    of alerts triggered.
+    """
+    from psycopg2.extras import execute_values
+
+    changes = [c for c in changes if c[3] is not None]
+    if not changes:
+        return 0
+    if index is None:
+        triggered = execute_values(cur, """
+            INSERT INTO alert_triggers (alert_id, product_id, vendor_id, price, previous_price)
+            SELECT a.alert_id, c.product_id, c.vendor_id, c.new_price, c.old_price
+            FROM (
+                SELECT d.product_id::int AS product_id, d.vendor_id::int AS vendor_id,
+                       d.old_price::float8 AS old_price, d.new_price::float8 AS new_price
+                FROM (VALUES %s) AS d(product_id, vendor_id, old_price, new_price)
+            ) c
+            JOIN alerts a ON a.product_id_reference = c.product_id
+                AND a.price_alert >= c.new_price
+                AND (c.old_price IS NULL OR a.price_alert < c.old_price)
+            RETURNING trigger_id
+        """, changes, fetch=True)
+        return len(triggered)
+
+    index.sync(cur)
+    rows = []
+    for product_id, vendor_id, old_price, new_price in changes:
+        for _, alert_id, _ in index.crossed(product_id, old_price, new_price):
+            rows.append((alert_id, product_id, vendor_id, new_price, old_price))
+    if not rows:
+        return 0
+    # joining alerts skips anything deleted since the index was loaded
+    triggered = execute_values(cur, """
+        INSERT INTO alert_triggers (alert_id, product_id, vendor_id, price, previous_price)
+        SELECT a.alert_id, t.product_id, t.vendor_id, t.price, t.previous_price
+        FROM (
+            SELECT d.alert_id::int AS alert_id, d.product_id::int AS product_id, d.vendor_id::int AS vendor_id,
+                   d.price::float8 AS price, d.previous_price::float8 AS previous_price
+            FROM (VALUES %s) AS d(alert_id, product_id, vendor_id, price, previous_price)
+        ) t
+        JOIN alerts a ON a.alert_id = t.alert_id
+        RETURNING trigger_id
+    """, rows, fetch=True)
+    return len(triggered)
@@ -0,0 +1,95 @@
+"""
+Password hashing and the logged-in user's identity.
+Exports:
+ - hash_password(password) -> hash string for users.password_hash, using PASSWORD_HASH_METHOD
+ - verify_password(stored, password) -> (ok, needs_rehash); needs_rehash when stored uses another method
+ - authenticate(cur, login, password) -> identity dict for a user name or email, or None
+ - current_identity(user_id) -> cached {"user_id", "user_name", "email"}, or None if the user is gone
+ - forget(user_id) -> drops a cached identity (call after changing or deleting a user)
+
+The session stores the user_id that authenticate() verified (Flask signs the
+session cookie, so it cannot be forged), so requests never resolve the user
+by name again. Identities are cached per process for IDENTITY_CACHE_TTL
+seconds; a deleted user is logged out within that time.
+
+Configuration (environment):
+ - PASSWORD_HASH_METHOD  werkzeug method for new hashes, e.g. "scrypt" or
+                         "pbkdf2:sha256:600000" (default: werkzeug's default).
+                         Older hashes are upgraded on the next successful login.
+ - IDENTITY_CACHE_TTL    seconds a looked-up identity is reused (default 300)
+ - IDENTITY_CACHE_SIZE   identities kept per process (default 4096)
+"""
+import os
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from cache import TTLCache
+from db import db_connection
+
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or None
+IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", "300"))
+identity_cache = TTLCache(maxsize=int(os.environ.get("IDENTITY_CACHE_SIZE", "4096")), ttl=IDENTITY_CACHE_TTL)
+
+_hash_prefixes = {}
+
+
+def hash_password(password):
+    if PASSWORD_HASH_METHOD:
+        return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+    return generate_password_hash(password)
+
+
+def _current_prefix():
+    """'scrypt:32768:8:1' etc.: the method part of a hash made with the configured method."""
+    prefix = _hash_prefixes.get(PASSWORD_HASH_METHOD)
+    if prefix is None:
+        prefix = _hash_prefixes[PASSWORD_HASH_METHOD] = hash_password("").split("$", 1)[0]
+    return prefix
+
+
+def verify_password(stored, password):
+    if not stored or not password or not check_password_hash(stored, password):
+        return False, False
+    return True, stored.split("$", 1)[0] != _current_prefix()
+
+
+def authenticate(cur, login, password):
+    """Check a user name or email and password; upgrades the stored hash when the method changed."""
+    cur.execute("""
+        SELECT user_id, user_name, email, password_hash FROM users
+        WHERE user_name = %s OR email = %s
+        ORDER BY user_id LIMIT 1
+    """, (login, login))
+    row = cur.fetchone()
+    if not row:
+        return None
+    user_id, user_name, email, stored = row
+    ok, needs_rehash = verify_password(stored, password)
+    if not ok:
+        return None
+    if needs_rehash:
+        cur.execute("UPDATE users SET password_hash = %s WHERE user_id = %s", (hash_password(password), user_id))
+    identity = {"user_id": user_id, "user_name": user_name, "email": email}
+    identity_cache.set(user_id, identity)
+    return identity
+
+
+def current_identity(user_id):
+    if user_id is None:
+        return None
+    identity = identity_cache.get(user_id)
+    if identity is None:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT user_id, user_name, email FROM users WHERE user_id = %s", (user_id,))
+            row = cur.fetchone()
+            cur.close()
+        if not row:
+            return None
+        identity = {"user_id": row[0], "user_name": row[1], "email": row[2]}
+        identity_cache.set(user_id, identity)
+    return identity
+
+
+def forget(user_id):
+    identity_cache.pop(user_id)
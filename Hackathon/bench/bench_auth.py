@@ -0,0 +1,146 @@
+"""
+Login and alert-creation throughput benchmark.
+
+Creates scratch users (authbench-*) in the database at DATABASE_URL, then
+for each password hash method logs them in through the Flask test client
+and has every logged-in session create alerts, from --threads threads at
+once. Prints requests/s and p50/p99 latency per phase, and the identity
+cache hit rate. With --no-identity-cache every request looks its user up
+again, for comparison. The scratch users and their alerts are deleted at
+the end.
+
+Usage (from the Hackathon directory):
+    python bench/bench_auth.py --users 50 --alerts 20 --threads 8 --methods scrypt pbkdf2:sha256:600000 pbkdf2:sha256:100000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from bench_refresh import percentile  # noqa: E402
+
+PASSWORD = "bench-password"
+
+
+def timed(fn, jobs, threads):
+    """Run fn(job) for every job on `threads` threads; returns (seconds, latencies, failures)."""
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def run(job):
+        started = time.perf_counter()
+        ok = fn(job)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                failures.append(job)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(run, jobs))
+    return time.perf_counter() - started, latencies, failures
+
+
+def report(phase, count, seconds, latencies, failures):
+    print(f"  {phase:<8} {count:>6} {seconds:>7.2f}s {count / seconds if seconds else 0:>9.1f}/s "
+          f"p50 {percentile(latencies, 50) * 1000:>7.1f} ms  p99 {percentile(latencies, 99) * 1000:>7.1f} ms"
+          f"{f'  failed {len(failures)}' if failures else ''}")
+
+
+def cleanup(cur):
+    cur.execute("DELETE FROM alert_triggers WHERE alert_id IN (SELECT a.alert_id FROM alerts a "
+                "JOIN users u ON u.user_id = a.user_id_reference WHERE u.user_name LIKE 'authbench-%%')")
+    cur.execute("DELETE FROM alerts WHERE user_id_reference IN (SELECT user_id FROM users WHERE user_name LIKE 'authbench-%%')")
+    cur.execute("DELETE FROM users WHERE user_name LIKE 'authbench-%%'")
+
+
+def run(args):
+    from psycopg2.extras import execute_values
+
+    import auth
+    from aplications import create_app
+    from db import db_connection
+    from migrations import migrate
+
+    migrate(verbose=False)
+    app = create_app({"TESTING": True})
+    if args.no_identity_cache:
+        auth.identity_cache.ttl = 0
+
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cleanup(cur)
+        cur.execute("SELECT product_id FROM products ORDER BY product_id LIMIT 1")
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("INSERT INTO products (product_name, category) VALUES ('Auth bench product', 'Bench') RETURNING product_id")
+            row = cur.fetchone()
+        product_id = row[0]
+        conn.commit()
+        cur.close()
+
+    print(f"users={args.users} alerts/user={args.alerts} threads={args.threads} "
+          f"identity cache={'off' if args.no_identity_cache else 'on'}")
+    try:
+        for method in args.methods:
+            auth.PASSWORD_HASH_METHOD = method
+            names = [f"authbench-{i}" for i in range(args.users)]
+            started = time.perf_counter()
+            hashes = [auth.hash_password(PASSWORD) for _ in names]
+            hash_ms = (time.perf_counter() - started) * 1000 / len(names)
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cleanup(cur)
+                execute_values(cur, "INSERT INTO users (user_name, email, password_hash) VALUES %s",
+                               [(n, f"{n}@bench.example.in", h) for n, h in zip(names, hashes)])
+                conn.commit()
+                cur.close()
+            print(f"{method}: {hash_ms:.1f} ms per hash")
+
+            clients = {}
+
+            def login(name):
+                client = app.test_client()
+                resp = client.post("/login", data={"username": name, "password": PASSWORD})
+                clients[name] = client
+                return resp.status_code == 302 and resp.headers.get("Location", "").endswith("/dashboard")
+
+            report("login", len(names), *timed(login, names, args.threads))
+
+            hits_before = auth.identity_cache.hits
+
+            def add_alert(job):
+                name, n = job
+                resp = clients[name].post("/alerts", json={"product_id": product_id, "price_alert": 100 + n})
+                return resp.status_code == 200
+
+            jobs = [(name, n) for n in range(args.alerts) for name in names]
+            report("alert", len(jobs), *timed(add_alert, jobs, args.threads))
+            print(f"  identity cache hits {auth.identity_cache.hits - hits_before}/{len(jobs)}")
+    finally:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cleanup(cur)
+            conn.commit()
+            cur.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--alerts", type=int, default=20, help="alerts each logged-in user creates")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--methods", nargs="+", default=["scrypt", "pbkdf2:sha256:600000", "pbkdf2:sha256:100000"],
+                        help="werkzeug password hash methods to compare")
+    parser.add_argument("--no-identity-cache", action="store_true", help="look the user up on every request")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
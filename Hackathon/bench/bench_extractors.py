@@ -0,0 +1,106 @@
+"""
+Parse-throughput benchmark for extractors.py.
+
+Runs every saved page in bench/fixtures/ through its domain's extractor and
+reports pages/sec, ms/page and the extracted price. Fixtures are padded with
+filler review markup up to --size KB so the numbers
+reflect real product-page sizes. If BeautifulSoup is installed the old
+full-tree soup parse is timed alongside for comparison.
+
+Usage (from the Hackathon directory):
+    python bench/bench_extractors.py [--size 400] [--seconds 2]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from extractors import extract_price, get_extractor  # noqa: E402
+from pages import FIXTURES, render_page  # noqa: E402
+
+URLS = {name: f"https://{host}/sample-product" for name, host in FIXTURES.items()}
+EXPECTED = {
+    "amazon.html": 2499.0,
+    "flipkart.html": 17999.0,
+    "jsonld.html": 54990.0,
+    "generic.html": 3299.0,
+}
+
+
+def legacy_extract(html, url):
+    """The previous requests-path parser: BeautifulSoup tree + CSS selectors + first number."""
+    from urllib.parse import urlparse
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    domain = urlparse(url).netloc.lower()
+    if "amazon." in domain:
+        selectors = ["#priceblock_ourprice", "#priceblock_dealprice", "#price_inside_buybox", ".a-color-price"]
+    elif "flipkart." in domain:
+        selectors = ["._30jeq3._16Jk6d", "._1vC4OE"]
+    else:
+        selectors = ["meta[itemprop='price']", "[class*=price]", "[id*=price]"]
+    text = None
+    for sel in selectors:
+        el = soup.select_one(sel)
+        if el:
+            text = el.get_text().strip()
+            break
+    if not text:
+        text = soup.get_text(separator=' ')
+    m = re.search(r'[\d\.,]+', text.replace('\xa0', ' '))
+    try:
+        return float(m.group(0).replace(',', '')) if m else None
+    except ValueError:
+        return None
+
+
+def bench(fn, html, url, seconds):
+    runs = 0
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    while True:
+        fn(html, url)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            break
+    cpu = time.process_time() - cpu_started
+    return runs / elapsed, cpu / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=400, help="pad each page to this many KB (default 400)")
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent per fixture and parser")
+    args = parser.parse_args()
+
+    try:
+        import bs4  # noqa: F401
+        have_bs4 = True
+    except ImportError:
+        have_bs4 = False
+
+    print(f"{'fixture':<14} {'extractor':<10} {'price':>10} {'pages/s':>9} {'cpu ms':>8}"
+          + (f" {'bs4 price':>10} {'pages/s':>9} {'cpu ms':>8} {'speedup':>8}" if have_bs4 else ""))
+    for name, url in URLS.items():
+        html = render_page(name, EXPECTED[name], args.size)
+        price, _ = extract_price(html, url)
+        rate, cpu_ms = bench(extract_price, html, url, args.seconds)
+        line = f"{name:<14} {get_extractor(url).name:<10} {price!s:>10} {rate:>9.1f} {cpu_ms:>8.2f}"
+        if have_bs4:
+            old_price = legacy_extract(html, url)
+            old_rate, old_cpu_ms = bench(legacy_extract, html, url, args.seconds)
+            line += f" {old_price!s:>10} {old_rate:>9.1f} {old_cpu_ms:>8.2f} {rate / old_rate:>7.1f}x"
+        if price != EXPECTED[name]:
+            line += f"  (expected {EXPECTED[name]})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Refresh-cycle benchmark for price_fetcher.update_all_prices.
+
+Starts bench/replay_server.py in-process as an HTTP proxy, points the fetcher
+at it and runs a number of refresh cycles against the database at
+BENCH_DATABASE_URL. Every listing there gets the replay server's prices, so
+it must be a scratch database: the bench refuses to run without that
+variable and never uses DATABASE_URL. Between cycles the server moves to a
+new epoch so a share of the prices change. Per cycle it prints throughput
+(URLs/s), p50/p99 fetch latency, DB write time and the fetcher's own
+counters; at the end the peak memory of the process (and, for Playwright, of
+its browser processes).
+
+The listings must use http:// URLs: build a scratch dataset with --generate
+(or bench/make_dataset.py) first; --truncate empties every application table
+before generating. With --backend both, each backend runs in its own process
+so their peak memory is measured separately.
+
+Usage (from the Hackathon directory):
+    BENCH_DATABASE_URL=postgresql://localhost/shopsmartley_bench \
+    python bench/bench_refresh.py --truncate --generate 500 --backend both --cycles 3 --latency 120 --errors 0.01
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from replay_server import ReplayServer  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024.0
+
+
+def instrument(pf):
+    """Wrap price_fetcher.fetch_result (looked up by fetch_many at call time) to record latencies."""
+    latencies = []
+    lock = threading.Lock()
+    fetch_result = pf.fetch_result
+
+    def timed_fetch_result(url):
+        started = time.perf_counter()
+        try:
+            return fetch_result(url)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    pf.fetch_result = timed_fetch_result
+    return latencies
+
+
+def run(args):
+    server = ReplayServer(latency_ms=args.latency, jitter_ms=args.jitter, error_rate=args.errors,
+                          rate_limit_rate=args.rate_limited, change_rate=args.change_rate,
+                          page_kb=args.page_kb, etags=not args.no_etags).start()
+    os.environ.update({
+        "HTTP_PROXY": server.url, "http_proxy": server.url, "PLAYWRIGHT_PROXY": server.url,
+        "PRICE_FETCH_BACKEND": args.backend,
+    })
+    os.environ.pop("NO_PROXY", None)
+    os.environ.pop("no_proxy", None)
+    if not args.keep_validators:
+        os.environ["PRICE_HTTP_CACHE"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "validators.sqlite")
+
+    import price_fetcher as pf
+    from db import db_connection
+    from migrations import migrate
+
+    if args.backend == "playwright" and not pf.USE_PLAYWRIGHT:
+        sys.exit("Playwright is not installed (pip install playwright && playwright install chromium)")
+    migrate(verbose=False)
+    if args.generate or args.truncate:
+        from make_dataset import generate, truncate
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if args.truncate:
+                truncate(cur)
+            if args.generate:
+                print("dataset:", generate(cur, products=args.generate, listings=args.listings,
+                                           users=max(1, args.generate // 10), alerts=args.generate))
+            conn.commit()
+            cur.close()
+
+    latencies = instrument(pf)
+    print(f"backend={args.backend} proxy={server.url} workers={args.workers or pf.FETCH_WORKERS} "
+          f"per_domain={args.per_domain or pf.FETCH_PER_DOMAIN} domain_interval={args.domain_interval}")
+    print(f"{'cycle':>5} {'urls':>6} {'secs':>7} {'urls/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'db ms':>7} "
+          f"{'changed':>8} {'failed':>7} {'304s':>5} {'parse s':>8}  errors")
+    totals = {"urls": 0, "duration": 0.0, "db_write": 0.0}
+    all_latencies = []
+    for cycle in range(args.cycles):
+        if cycle:
+            server.advance()
+        del latencies[:]
+        report = pf.update_all_prices(workers=args.workers, per_domain=args.per_domain,
+                                      domain_interval=args.domain_interval)
+        all_latencies.extend(latencies)
+        rate = report["urls"] / report["duration"] if report["duration"] else 0.0
+        http = report.get("http", {})
+        print(f"{cycle + 1:>5} {report['urls']:>6} {report['duration']:>7.2f} {rate:>8.1f} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} "
+              f"{report['db_write'] * 1000:>7.0f} {report['changed']:>8} {report['failed']:>7} "
+              f"{http.get('not_modified', 0):>5} {http.get('parse_cpu', 0):>8.2f}  {report.get('errors') or ''}")
+        totals["urls"] += report["urls"]
+        totals["duration"] += report["duration"]
+        totals["db_write"] += report["db_write"]
+
+    if pf.USE_PLAYWRIGHT and pf._browser_pool is not None:
+        # browsers only show up in RUSAGE_CHILDREN once they have exited
+        pf._browser_pool.shutdown()
+    server.stop()
+    print(f"total: {totals['urls']} urls in {totals['duration']:.2f}s "
+          f"({totals['urls'] / totals['duration'] if totals['duration'] else 0:.1f} urls/s), "
+          f"p50 {percentile(all_latencies, 50) * 1000:.1f} ms, p99 {percentile(all_latencies, 99) * 1000:.1f} ms, "
+          f"db write {totals['db_write'] / max(1, args.cycles) * 1000:.0f} ms/cycle")
+    print(f"peak rss: {peak_rss_mb():.1f} MB" + (
+        f", largest browser process {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MB" if pf.USE_PLAYWRIGHT else ""))
+    print(f"replay server: {server.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["requests", "playwright", "both"], default="requests")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--generate", type=int, default=0, help="generate this many products first")
+    parser.add_argument("--truncate", action="store_true", help="empty the application tables first")
+    parser.add_argument("--listings", type=int, default=3, help="listings per generated product")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--per-domain", type=int, default=None)
+    parser.add_argument("--domain-interval", type=float, default=0.0,
+                        help="politeness delay per domain (default 0: measure the fetcher, not the throttle)")
+    parser.add_argument("--latency", type=float, default=100, help="server latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=50, help="extra random latency in ms")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of 500 responses")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="share of prices changing per cycle")
+    parser.add_argument("--page-kb", type=int, default=300)
+    parser.add_argument("--no-etags", action="store_true", help="server never answers 304")
+    parser.add_argument("--keep-validators", action="store_true",
+                        help="reuse the fetcher's on-disk ETag cache instead of a fresh one")
+    args = parser.parse_args()
+
+    if not os.environ.get("BENCH_DATABASE_URL"):
+        sys.exit("Set BENCH_DATABASE_URL to a scratch database: the bench overwrites every price in it")
+    # db reads DATABASE_URL on import; the child processes below inherit it
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+    if args.backend != "both":
+        return run(args)
+    argv = sys.argv[1:]
+    if "--backend" in argv:
+        del argv[argv.index("--backend"):argv.index("--backend") + 2]
+    for i, backend in enumerate(["requests", "playwright"]):
+        # only the first run regenerates the dataset so both backends see the same catalogue
+        if i and "--generate" in argv:
+            del argv[argv.index("--generate"):argv.index("--generate") + 2]
+        if i and "--truncate" in argv:
+            argv.remove("--truncate")
+        print(f"=== {backend} ===", flush=True)
+        subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--backend", backend])
+
+
+if __name__ == "__main__":
+    main()
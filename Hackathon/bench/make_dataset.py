@@ -0,0 +1,128 @@
+"""
+Synthetic catalogue for refresh benchmarks.
+
+Fills the database at DATABASE_URL with products, one vendor row per
+listing (Amazon, Flipkart and a spread of smaller shops), product_prices
+rows, users, price alerts set just under the current prices so alert
+evaluation has work to do, and deals around the current prices (some
+beating them, some not) for the deal ranking. Listing URLs use http:// so the fetcher's
+requests can be routed through bench/replay_server.py acting as a proxy.
+
+Use a scratch database: --truncate empties every application table first.
+
+Usage (from the Hackathon directory):
+    python bench/make_dataset.py --products 2000 [--listings 3] [--shops 25] [--users 200] [--alerts 2000] [--deals 500] [--truncate]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from db import db_connection  # noqa: E402
+from deal_ranking import rebuild_rankings  # noqa: E402
+from price_summary import rebuild_summaries  # noqa: E402
+
+CATEGORIES = ["Phones", "Laptops", "Audio", "Wearables", "Cameras", "Appliances", "Gaming", "Accessories"]
+TABLES = ["alert_triggers", "price_history", "price_history_hourly", "alerts", "deal_rankings", "deals",
+          "product_price_summary", "product_prices", "products", "vendors", "users"]
+
+
+def listing_url(domain, product_id, n):
+    if domain == "www.amazon.in":
+        return f"http://{domain}/dp/B{product_id:09d}"
+    if domain == "www.flipkart.com":
+        return f"http://{domain}/p/itm{product_id:013d}"
+    return f"http://{domain}/products/{product_id}-{n}"
+
+
+def generate(cur, products=1000, listings=3, shops=25, users=100, alerts=1000, seed=1, deals=0):
+    """Insert the synthetic catalogue with the given cursor; returns the row counts."""
+    from psycopg2.extras import execute_values
+
+    rng = random.Random(seed)
+    domains = ["www.amazon.in", "www.flipkart.com"] + [f"www.shop{i:02d}.example.in" for i in range(shops)]
+
+    product_ids = [r[0] for r in execute_values(
+        cur, "INSERT INTO products (product_name, category) VALUES %s RETURNING product_id",
+        [(f"Bench product {i}", rng.choice(CATEGORIES)) for i in range(products)], fetch=True)]
+
+    vendor_rows = []
+    for product_id in product_ids:
+        for n, domain in enumerate(rng.sample(domains, min(listings, len(domains)))):
+            vendor_rows.append((f"{domain.split('.')[1].title()} #{product_id}-{n}", listing_url(domain, product_id, n),
+                                product_id))
+    vendor_ids = [r[0] for r in execute_values(
+        cur, "INSERT INTO vendors (vendor_name, website_url) VALUES %s RETURNING vendor_id",
+        [(name, url) for name, url, _ in vendor_rows], fetch=True)]
+
+    prices = [(product_id, vendor_id, float(rng.randint(199, 80_000)))
+              for (_, _, product_id), vendor_id in zip(vendor_rows, vendor_ids)]
+    execute_values(cur, "INSERT INTO product_prices (product_id, vendor_id, product_price) VALUES %s", prices)
+    rebuild_summaries(cur)
+
+    # users.email is UNIQUE: number this run's users after the existing ones, so generating
+    # into a database that was not truncated adds users instead of failing
+    cur.execute("SELECT COALESCE(max(user_id), 0) FROM users")
+    offset = cur.fetchone()[0]
+    user_ids = [r[0] for r in execute_values(
+        cur, "INSERT INTO users (user_name, email, password_hash) VALUES %s RETURNING user_id",
+        [(f"bench{offset + i}", f"bench{offset + i}-{seed}@example.in", None) for i in range(users)], fetch=True)]
+    if user_ids and alerts:
+        execute_values(cur, "INSERT INTO alerts (user_id_reference, product_id_reference, price_alert) VALUES %s", [
+            (rng.choice(user_ids), product_id, round(price * rng.uniform(0.8, 1.0), 2))
+            for product_id, _, price in rng.sample(prices, min(alerts, len(prices)))
+        ])
+    if deals:
+        today = date.today()
+        execute_values(cur, "INSERT INTO deals (product_id, vendor_id, deal_price, start_date, end_date) VALUES %s", [
+            (product_id, vendor_id, round(price * rng.uniform(0.6, 1.1), 2),
+             today - timedelta(days=rng.randint(0, 10)), today + timedelta(days=rng.randint(-2, 30)))
+            for product_id, vendor_id, price in rng.sample(prices, min(deals, len(prices)))
+        ])
+        rebuild_rankings(cur)
+    return {"products": len(product_ids), "listings": len(vendor_ids), "domains": len(domains),
+            "users": len(user_ids), "alerts": min(alerts, len(prices)) if user_ids else 0,
+            "deals": min(deals, len(prices))}
+
+
+def truncate(cur):
+    cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename = ANY(%s)", (TABLES,))
+    existing = [r[0] for r in cur.fetchall()]
+    if existing:
+        cur.execute(f"TRUNCATE {', '.join(existing)} RESTART IDENTITY CASCADE")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--listings", type=int, default=3, help="vendor listings per product")
+    parser.add_argument("--shops", type=int, default=25, help="small shops besides Amazon and Flipkart")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--alerts", type=int, default=1000)
+    parser.add_argument("--deals", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--truncate", action="store_true", help="empty the application tables first")
+    args = parser.parse_args()
+
+    from migrations import migrate
+    migrate(verbose=False)
+
+    started = time.monotonic()
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if args.truncate:
+            truncate(cur)
+        counts = generate(cur, args.products, args.listings, args.shops, args.users, args.alerts, args.seed,
+                          args.deals)
+        conn.commit()
+        cur.close()
+    print(f"{counts} in {time.monotonic() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
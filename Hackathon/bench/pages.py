@@ -0,0 +1,67 @@
+"""
+Recorded product pages for the benchmarks.
+Exports:
+ - FIXTURES -> {fixture file: the domain it was saved from}
+ - fixture_for(url) -> the fixture file a URL is served from
+ - render_page(name, price, size_kb=0) -> page bytes with the price filled in,
+   padded with filler markup (reviews) to about size_kb KB
+
+Fixtures carry two placeholders: %PRICE% ("2,499") and %PRICE_RAW% ("2499.00").
+"""
+import os
+import zlib
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = {
+    "amazon.html": "www.amazon.in",
+    "flipkart.html": "www.flipkart.com",
+    "jsonld.html": "www.example-store.in",
+    "generic.html": "www.example-shop.in",
+}
+
+FILLER_BLOCK = (
+    '<div class="review"><div class="review-header"><span class="author">Customer {i}</span>'
+    '<span class="stars">4.0 out of 5</span></div><p class="review-body">Works as described, '
+    'delivery took {d} days and the box was intact. Battery lasts about {h} hours.</p>'
+    '<ul class="meta"><li>Verified purchase</li><li>{i} people found this helpful</li></ul></div>\n'
+)
+
+_templates = {}
+_fillers = {}
+
+
+def fixture_for(url):
+    """amazon / flipkart URLs get their own page; any other shop gets one of the generic layouts."""
+    host = url.split("//", 1)[-1].split("/", 1)[0].lower()
+    if "amazon." in host:
+        return "amazon.html"
+    if "flipkart." in host:
+        return "flipkart.html"
+    return "jsonld.html" if zlib.crc32(host.encode()) % 2 else "generic.html"
+
+
+def _template(name):
+    if name not in _templates:
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+            _templates[name] = f.read()
+    return _templates[name]
+
+
+def _filler(size_kb):
+    if size_kb not in _fillers:
+        blocks = []
+        total = 0
+        i = 0
+        while total < size_kb * 1024:
+            block = FILLER_BLOCK.format(i=i, d=i % 7 + 1, h=i % 40 + 8)
+            blocks.append(block)
+            total += len(block)
+            i += 1
+        _fillers[size_kb] = "".join(blocks)
+    return _fillers[size_kb]
+
+
+def render_page(name, price, size_kb=0):
+    page = _template(name)
+    page = page.replace("%PRICE_RAW%", f"{price:.2f}").replace("%PRICE%", f"{price:,.0f}")
+    return page.replace("%FILLER%", _filler(max(0, size_kb - len(page) // 1024))).encode("utf-8")
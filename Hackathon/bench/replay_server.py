@@ -0,0 +1,164 @@
+"""
+Local stand-in for the shops price_fetcher scrapes.
+
+Serves the recorded pages in bench/fixtures/ for any URL, either as a plain
+HTTP server or as an HTTP proxy (point HTTP_PROXY / PLAYWRIGHT_PROXY at it and
+keep the listing URLs on http://). Every URL gets a stable price derived from
+the URL; each call to advance() starts a new "epoch" in which a fraction of
+the URLs change price, so refresh cycles see realistic churn.
+
+Knobs: per-request latency (+ jitter), a share of 500 errors, a share of 429
+rate-limit responses and whether ETag / If-None-Match revalidation is honoured.
+
+Usage (from the Hackathon directory):
+    python bench/replay_server.py [--port 8800] [--latency 150] [--errors 0.02] [--rate-limited 0.01]
+"""
+import argparse
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pages import fixture_for, render_page
+
+
+class ReplayServer:
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 rate_limit_rate=0.0, change_rate=0.1, page_kb=300, etags=True, seed=0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.change_rate = change_rate
+        self.page_kb = page_kb
+        self.etags = etags
+        self.epoch = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "200": 0, "304": 0, "429": 0, "500": 0, "bytes": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="replay-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def advance(self):
+        """Start the next epoch: about change_rate of all URLs get a new price."""
+        with self.lock:
+            self.epoch += 1
+
+    def price_for(self, url):
+        base = 199 + zlib.crc32(url.encode()) % 80_000
+        # the price moves in the epochs whose hash falls under change_rate
+        price = base
+        for epoch in range(1, self.epoch + 1):
+            h = zlib.crc32(f"{url}#{epoch}".encode())
+            if h % 10_000 < self.change_rate * 10_000:
+                price = base * (0.8 + (h >> 16) % 400 / 1000.0)
+        return round(price)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, epoch=self.epoch)
+
+    def _count(self, status, size=0):
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts[str(status)] += 1
+            self.counts["bytes"] += size
+
+    def _roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                # proxy requests carry the absolute URL, direct ones only the path
+                if self.path.startswith("http"):
+                    url = self.path
+                else:
+                    url = f"http://{self.headers.get('Host', 'localhost')}{self.path}"
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + server.jitter * server._roll())
+
+                roll = server._roll()
+                if roll < server.error_rate:
+                    return self._send(500, b"upstream error")
+                if roll < server.error_rate + server.rate_limit_rate:
+                    return self._send(429, b"slow down", {"Retry-After": "30"})
+
+                price = server.price_for(url)
+                etag = f'"{zlib.crc32(f"{url}:{price}".encode()):08x}"'
+                if server.etags and self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", {"ETag": etag})
+                body = render_page(fixture_for(url), price, server.page_kb)
+                headers = {"Content-Type": "text/html; charset=utf-8"}
+                if server.etags:
+                    headers["ETag"] = etag
+                self._send(200, body, headers)
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+                server._count(status, len(body))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0, help="added latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="extra random latency in ms (uniform)")
+    parser.add_argument("--errors", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--change-rate", type=float, default=0.1, help="share of URLs whose price changes per epoch")
+    parser.add_argument("--epoch-seconds", type=float, default=0, help="advance the epoch this often (0 = never)")
+    parser.add_argument("--page-kb", type=int, default=300, help="pad pages to this size")
+    parser.add_argument("--no-etags", action="store_true", help="never answer 304")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.host, args.port, args.latency, args.jitter, args.errors, args.rate_limited,
+                          args.change_rate, args.page_kb, not args.no_etags).start()
+    print(f"Replaying fixtures on {server.url} (use it as HTTP_PROXY / PLAYWRIGHT_PROXY)")
+    try:
+        while True:
+            if args.epoch_seconds:
+                time.sleep(args.epoch_seconds)
+                server.advance()
+                print(f"epoch {server.epoch}: {server.stats()}")
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
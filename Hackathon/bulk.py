@@ -0,0 +1,352 @@
+"""
+Bulk import/export of the catalogue (products, vendors and their prices).
+Exports:
+ - import_catalogue(lines, fmt) -> streams CSV/NDJSON lines into the database, returns a report
+ - export_catalogue(fmt) -> generator of CSV/NDJSON chunks, one row per listing
+ - FIELDS -> the column order of both formats
+
+One record per listing: product_name, category, vendor_name, vendor_website,
+price. Rows without a vendor only create the product; rows without a price
+create the product and vendor but no listing.
+
+Records are parsed lazily, COPYed into a temporary staging table in batches
+of BULK_BATCH_ROWS and merged with a few set-based statements per batch, so
+memory does not grow with the size of the file. Each batch is committed on
+its own. Matching follows the rest of the app:
+ - vendors are matched by name (lowest vendor_id wins); a non-empty
+   vendor_website replaces the stored one, the last one in a batch wins
+ - products are matched by name (lowest product_id wins), otherwise created
+ - a listing that appears more than once in a batch takes the last price
+Changed prices go through price_events.on_prices_changed like any other write.
+
+CLI (from the Hackathon directory):
+    python bulk.py import feed.csv [--format ndjson] [--batch 50000]
+    python bulk.py export catalogue.csv [--format ndjson]     # "-" for stdout
+"""
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from cache import generations, invalidate
+from db import db_connection, upsert_prices_from
+from price_events import on_prices_changed
+
+BULK_BATCH_ROWS = int(os.environ.get("BULK_BATCH_ROWS", "50000"))
+FIELDS = ("product_name", "category", "vendor_name", "vendor_website", "price")
+# same aliases add_product accepts
+ALIASES = {"website_url": "vendor_website", "website": "vendor_website", "vendor_url": "vendor_website",
+           "product_price": "price"}
+MAX_REPORTED_ERRORS = 20
+# how often a CSV export blocked on a slow reader checks whether it was cancelled
+EXPORT_PUT_TIMEOUT = 0.5
+
+
+class BulkFormatError(Exception):
+    pass
+
+
+def read_records(lines, fmt):
+    """Iterator of (line_number, dict) over an iterable of text lines.
+
+    Not a generator, so a bad format or CSV header is raised here rather than in the middle of a COPY.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or "product_name" not in [ALIASES.get(f.strip(), f.strip()) for f in reader.fieldnames]:
+            raise BulkFormatError("CSV header must include product_name")
+        return ((reader.line_num, record) for record in reader)
+    if fmt == "ndjson":
+        return _ndjson_records(lines)
+    raise BulkFormatError(f"unknown format {fmt!r} (csv or ndjson)")
+
+
+def _ndjson_records(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+
+def clean(record):
+    """Normalize one record to FIELDS; raises ValueError with a reason for bad rows."""
+    if record is None:
+        raise ValueError("not a JSON object")
+    row = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        key = ALIASES.get(key.strip(), key.strip())
+        if key in FIELDS:
+            value = "" if value is None else str(value).strip()
+            row[key] = value
+    if not row.get("product_name"):
+        raise ValueError("product_name is required")
+    price = row.get("price") or ""
+    if price:
+        try:
+            row["price"] = repr(float(price.replace(",", "")))
+        except ValueError:
+            raise ValueError(f"price {price!r} is not a number")
+        if not row.get("vendor_name"):
+            raise ValueError("a price needs a vendor_name")
+    return [row.get(f, "") for f in FIELDS]
+
+
+class CopySource:
+    """File-like object for COPY FROM STDIN that pulls CSV rows from a generator on demand."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ""
+
+    def read(self, size=8192):
+        while len(self.pending) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+    readline = read
+
+
+def merge_batch(cur):
+    """Merge bulk_staging into vendors, products and product_prices. Returns counts and price changes."""
+    counts = {}
+    # last non-empty website per vendor name in this batch
+    cur.execute("""
+        CREATE TEMP TABLE bulk_vendor_urls ON COMMIT DROP AS
+        SELECT DISTINCT ON (vendor_name) vendor_name, vendor_website
+        FROM bulk_staging WHERE vendor_name <> '' AND vendor_website <> ''
+        ORDER BY vendor_name, line DESC
+    """)
+    cur.execute("""
+        INSERT INTO vendors (vendor_name, website_url)
+        SELECT n.vendor_name, u.vendor_website
+        FROM (SELECT DISTINCT vendor_name FROM bulk_staging WHERE vendor_name <> '') n
+        LEFT JOIN bulk_vendor_urls u USING (vendor_name)
+        WHERE NOT EXISTS (SELECT 1 FROM vendors v WHERE v.vendor_name = n.vendor_name)
+        ORDER BY n.vendor_name
+    """)
+    counts["vendors_created"] = cur.rowcount
+    cur.execute("""
+        UPDATE vendors v SET website_url = u.vendor_website
+        FROM bulk_vendor_urls u
+        WHERE v.vendor_id = (SELECT min(vendor_id) FROM vendors WHERE vendor_name = u.vendor_name)
+          AND v.website_url IS DISTINCT FROM u.vendor_website
+    """)
+    counts["vendor_urls_updated"] = cur.rowcount
+    cur.execute("""
+        INSERT INTO products (product_name, category)
+        SELECT DISTINCT ON (s.product_name) s.product_name, NULLIF(s.category, '')
+        FROM bulk_staging s
+        WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.product_name = s.product_name)
+        ORDER BY s.product_name, s.line DESC
+    """)
+    counts["products_created"] = cur.rowcount
+    changes = upsert_prices_from(cur, """
+        SELECT DISTINCT ON (p.product_id, v.vendor_id)
+               p.product_id, v.vendor_id, s.price::float8 AS product_price
+        FROM bulk_staging s
+        JOIN LATERAL (SELECT min(product_id) AS product_id FROM products WHERE product_name = s.product_name) p ON TRUE
+        JOIN LATERAL (SELECT min(vendor_id) AS vendor_id FROM vendors WHERE vendor_name = s.vendor_name) v ON TRUE
+        WHERE s.price <> '' AND s.vendor_name <> '' AND v.vendor_id IS NOT NULL
+        ORDER BY p.product_id, v.vendor_id, s.line DESC
+    """)
+    cur.execute("SELECT count(*) FROM bulk_staging WHERE price <> '' AND vendor_name <> ''")
+    counts["listings"] = cur.fetchone()[0]
+    cur.execute("DROP TABLE bulk_vendor_urls")
+    return counts, changes
+
+
+def import_catalogue(lines, fmt="csv", batch_rows=None):
+    """Import an iterable of text lines (a file opened with newline="" for CSV). Returns a report."""
+    batch_rows = batch_rows or BULK_BATCH_ROWS
+    started = time.monotonic()
+    report = {"lines": 0, "rejected": 0, "errors": [], "batches": 0, "vendors_created": 0,
+              "vendor_urls_updated": 0, "products_created": 0, "listings": 0, "changed": 0,
+              "history_points": 0, "alerts_triggered": 0, "summaries_changed": 0, "deals_reranked": 0}
+    records = read_records(lines, fmt)
+    exhausted = False
+
+    def batch():
+        """Clean rows of the next batch, numbered for last-wins ordering."""
+        nonlocal exhausted
+        taken = 0
+        for number, record in records:
+            report["lines"] += 1
+            try:
+                row = clean(record)
+            except ValueError as e:
+                report["rejected"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": number, "error": str(e)})
+                continue
+            yield [number] + row
+            taken += 1
+            if taken >= batch_rows:
+                return
+        exhausted = True
+
+    while not exhausted:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS bulk_staging (
+                    line BIGINT, product_name TEXT, category TEXT, vendor_name TEXT, vendor_website TEXT, price TEXT
+                ) ON COMMIT DELETE ROWS
+            """)
+            cur.copy_expert("COPY bulk_staging FROM STDIN WITH (FORMAT csv)", CopySource(batch()))
+            cur.execute("SELECT count(*) FROM bulk_staging")
+            if not cur.fetchone()[0]:
+                cur.close()
+                break
+            counts, changes = merge_batch(cur)
+            for key, value in counts.items():
+                report[key] += value
+            stale = {"products", "vendors"}
+            for key, value in on_prices_changed(cur, changes, stale).items():
+                report[key] += value
+            report["changed"] += len(changes)
+            bumped = invalidate(cur, *stale)
+            conn.commit()
+            cur.close()
+        generations.apply(bumped)
+        report["batches"] += 1
+    report["duration"] = round(time.monotonic() - started, 2)
+    return report
+
+
+EXPORT_QUERY = """
+    SELECT p.product_name, p.category, v.vendor_name, v.website_url AS vendor_website, pp.product_price AS price
+    FROM products p
+    LEFT JOIN product_prices pp ON pp.product_id = p.product_id
+    LEFT JOIN vendors v ON v.vendor_id = pp.vendor_id
+    ORDER BY p.product_id, v.vendor_name
+"""
+
+
+class ExportCancelled(Exception):
+    """The reader of a CSV export went away; stops the COPY feeding it."""
+
+
+class _QueueWriter:
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data):
+        while True:
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+            try:
+                self.chunks.put(data, timeout=EXPORT_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+
+def _copy_out(query, chunks, errors, cancelled):
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", _QueueWriter(chunks, cancelled))
+            cur.close()
+    except Exception as e:
+        if not cancelled.is_set():
+            errors.append(e)
+    finally:
+        # nobody reads the queue once the export is cancelled
+        if not cancelled.is_set():
+            chunks.put(None)
+
+
+def export_catalogue(fmt="csv", itersize=2000):
+    """Yield the catalogue as text chunks. CSV comes straight from COPY TO STDOUT
+    (through a bounded queue, so a slow client holds back the COPY instead of
+    buffering); NDJSON is read through a server-side cursor.
+
+    Closing the generator early (the client disconnected) stops the COPY and
+    returns its connection to the pool."""
+    if fmt == "csv":
+        chunks, errors, cancelled = queue.Queue(maxsize=64), [], threading.Event()
+        worker = threading.Thread(target=_copy_out, args=(EXPORT_QUERY, chunks, errors, cancelled), daemon=True)
+        worker.start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                yield chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        finally:
+            if worker.is_alive():
+                cancelled.set()
+                # unblock a put() in progress; the next write() sees the event and raises
+                while not chunks.empty():
+                    chunks.get_nowait()
+            worker.join()
+        if errors:
+            raise errors[0]
+    elif fmt == "ndjson":
+        with db_connection() as conn:
+            cur = conn.cursor(name="bulk_export")
+            cur.itersize = itersize
+            cur.execute(f"SELECT row_to_json(t)::text FROM ({EXPORT_QUERY}) t")
+            for (line,) in cur:
+                yield line + "\n"
+            cur.close()
+    else:
+        raise BulkFormatError(f"unknown format {fmt!r} (csv or ndjson)")
+
+
+def format_for(path, fmt=None):
+    if fmt:
+        return fmt
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import/export of products, vendors and prices.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import a CSV or NDJSON feed ('-' for stdin)")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["csv", "ndjson"])
+    imp.add_argument("--batch", type=int, default=None, help=f"rows per batch (default {BULK_BATCH_ROWS})")
+    exp = sub.add_parser("export", help="export the catalogue ('-' for stdout)")
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=["csv", "ndjson"])
+    args = parser.parse_args(argv)
+
+    fmt = format_for(args.path, args.format)
+    if args.command == "import":
+        f = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+        with f:
+            report = import_catalogue(f, fmt, args.batch)
+        print(json.dumps(report, indent=2), file=sys.stderr)
+    else:
+        f = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8", newline="")
+        with f:
+            for chunk in export_catalogue(fmt):
+                f.write(chunk)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
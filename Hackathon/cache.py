@@ -0,0 +1,277 @@
+"""
+Small in-process caches shared by the web app.
+Exports:
+ - TTLCache(maxsize, ttl) -> thread-safe LRU cache whose entries expire after ttl seconds
+ - RedisBackend(url) -> the same get/set interface on a shared Redis (optional dependency)
+ - ResponseCache(backend) -> serialized responses keyed by request and tag generations
+ - invalidate(cur, *tags) -> bumps tag generations inside the writer's transaction
+ - generations -> this process's view of the tag generations, kept current with LISTEN
+
+Response caching is invalidated by generation, not by deleting keys: every
+cached response is stored under the current generation of each of its tags
+(e.g. "products"), and a write bumps the generation in cache_generations and
+NOTIFYs every process when it commits, so old entries simply stop being
+looked up. A process that is not listening (or lost its connection) bypasses
+the response cache instead of risking stale reads.
+"""
+import hashlib
+import json
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "True").lower() in ("true", "1", "t")
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "300"))
+# when set, responses are shared by every process through Redis instead of kept per process
+REDIS_URL = os.environ.get("REDIS_URL")
+INVALIDATION_CHANNEL = "cache_invalidate"
+
+
+class TTLCache:
+    """LRU cache with a per-entry time-to-live.
+
+    The least recently used entry is evicted once `maxsize` is reached;
+    expired entries are dropped lazily when they are looked up.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class RedisBackend:
+    """TTLCache-compatible get/set over Redis. Redis errors count as misses."""
+
+    def __init__(self, url, prefix="shopsmart:response:"):
+        import redis  # optional dependency, only needed with REDIS_URL
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key, default=None):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception:
+            self.errors += 1
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=ttl or RESPONSE_CACHE_TTL)
+        except Exception:
+            self.errors += 1
+
+    def clear(self):
+        try:
+            for key in self.client.scan_iter(self.prefix + "*"):
+                self.client.delete(key)
+        except Exception:
+            self.errors += 1
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class Generations:
+    """tag -> generation, mirrored from the cache_generations table.
+
+    A daemon thread LISTENs on INVALIDATION_CHANNEL over its own connection
+    (started on first use, once per pid) and reloads the whole table whenever
+    it (re)connects, so no bump is missed while it was away. `live` is False
+    until the first load and whenever the connection is down.
+    """
+
+    def __init__(self, channel=INVALIDATION_CHANNEL, poll=5.0):
+        self.channel = channel
+        self.poll = poll
+        self.values = {}
+        self.lock = threading.Lock()
+        self.live = False
+        self.pid = None
+
+    def ensure_listening(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.live = False
+            self.values = {}
+            threading.Thread(target=self._run, name="cache-invalidation", daemon=True).start()
+
+    def current(self, tags):
+        """The generations of `tags`, or None while invalidations can't be trusted."""
+        self.ensure_listening()
+        with self.lock:
+            if not self.live:
+                return None
+            return tuple(self.values.get(t, 0) for t in tags)
+
+    def apply(self, bumped):
+        """Record (tag, generation) pairs; generations only move forward."""
+        with self.lock:
+            for tag, generation in bumped:
+                if generation > self.values.get(tag, 0):
+                    self.values[tag] = generation
+
+    def _run(self):
+        import psycopg2
+        from db import DATABASE_URL
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+                conn.autocommit = True
+                cur = conn.cursor()
+                # LISTEN before loading so nothing committed in between is lost
+                cur.execute(f"LISTEN {self.channel}")
+                cur.execute("SELECT to_regclass('cache_generations') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    cur.execute("SELECT tag, generation FROM cache_generations")
+                    self.apply(cur.fetchall())
+                with self.lock:
+                    self.live = True
+                while True:
+                    if select.select([conn], [], [], self.poll) == ([], [], []):
+                        cur.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    bumped = []
+                    while conn.notifies:
+                        tag, _, generation = conn.notifies.pop(0).payload.rpartition(":")
+                        bumped.append((tag, int(generation)))
+                    self.apply(bumped)
+            except Exception:
+                with self.lock:
+                    self.live = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(self.poll)
+
+
+generations = Generations()
+
+
+def invalidate(cur, *tags):
+    """Bump the generation of `tags` in the current transaction and NOTIFY on commit.
+
+    Returns the new (tag, generation) pairs; pass them to generations.apply()
+    after committing so this process reads its own writes right away. The tag
+    rows stay locked until the transaction ends, so call this once, right
+    before committing.
+    """
+    if not tags:
+        return []
+    # tags in a fixed order, so concurrent writers queue on the tag rows instead of deadlocking
+    cur.execute("""
+        WITH bumped AS (
+            INSERT INTO cache_generations (tag, generation) SELECT unnest(%s::text[]), 1
+            ON CONFLICT (tag) DO UPDATE SET generation = cache_generations.generation + 1
+            RETURNING tag, generation
+        )
+        SELECT tag, generation, pg_notify(%s, tag || ':' || generation) FROM bumped
+    """, (sorted(set(tags)), INVALIDATION_CHANNEL))
+    return [(r["tag"], r["generation"]) if isinstance(r, dict) else (r[0], r[1]) for r in cur.fetchall()]
+
+
+class ResponseCache:
+    """Serialized responses (body, headers, etag) keyed by request key and tag generations."""
+
+    def __init__(self, backend=None, ttl=None, enabled=None):
+        self.ttl = ttl or RESPONSE_CACHE_TTL
+        self.enabled = RESPONSE_CACHE if enabled is None else enabled
+        if backend is None:
+            backend = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=self.ttl)
+            if REDIS_URL:
+                try:
+                    backend = RedisBackend(REDIS_URL)
+                except Exception as e:
+                    print(f"Response cache: Redis unavailable ({e}), using the in-process cache")
+        self.backend = backend
+        self.bypassed = 0
+
+    def key(self, request_key, tags):
+        """Cache key for a request under the current generations, or None to bypass the cache."""
+        if not self.enabled:
+            return None
+        current = generations.current(tags)
+        if current is None:
+            self.bypassed += 1
+            return None
+        return request_key + "|" + ",".join(f"{t}={g}" for t, g in zip(tags, current))
+
+    def get(self, key):
+        return self.backend.get(key) if key else None
+
+    def store(self, key, body, headers):
+        entry = {"body": body, "headers": headers, "etag": hashlib.sha1(body.encode("utf-8")).hexdigest()[:24]}
+        if key:
+            self.backend.set(key, entry, ttl=self.ttl)
+        return entry
+
+    def stats(self):
+        return dict(self.backend.stats(), enabled=self.enabled, listening=generations.live,
+                    bypassed=self.bypassed)
@@ -0,0 +1,79 @@
+"""
+Ranked search over our own products table.
+Exports:
+ - PRODUCT_TSVECTOR -> the indexed full-text expression (migrations build a GIN index on it)
+ - search_catalogue(cur, q, limit) -> ranked products with their best current vendor price
+
+Every word of the query must prefix-match the product name or category
+("iph 14" finds "Apple iPhone 14"), stemmed with the english configuration.
+When the pg_trgm extension is installed, names within trigram word
+similarity of the query also match, which tolerates typos ("samsng").
+"""
+import os
+import re
+
+PRODUCT_TSVECTOR = "to_tsvector('english', coalesce(product_name, '') || ' ' || coalesce(category, ''))"
+# word_similarity() a name needs to count as a fuzzy match (pg_trgm only)
+SEARCH_FUZZY_THRESHOLD = float(os.environ.get("SEARCH_FUZZY_THRESHOLD", "0.5"))
+SEARCH_MAX_WORDS = 8
+
+_has_trigram = None
+
+
+def has_trigram(cur):
+    global _has_trigram
+    if _has_trigram is None:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        row = cur.fetchone()
+        _has_trigram = bool(row["exists"] if isinstance(row, dict) else row[0])
+    return _has_trigram
+
+
+def prefix_tsquery(q):
+    """'iph 14' -> 'iph:* & 14:*'; only word characters reach to_tsquery, so any input is safe."""
+    words = re.findall(r"\w+", q.lower())[:SEARCH_MAX_WORDS]
+    return " & ".join(f"{w}:*" for w in words)
+
+
+def search_catalogue(cur, q, limit=20):
+    """Products matching q, best match first, each with its cheapest current listing.
+
+    Returns an empty list when nothing matches well enough; callers can then
+    fall back to searching the shops themselves.
+    """
+    tsquery = prefix_tsquery(q)
+    fuzzy = has_trigram(cur)
+    if not tsquery and not fuzzy:
+        return []
+    if fuzzy:
+        # `<%` uses the trigram index with this threshold for the rest of the transaction
+        cur.execute("SET LOCAL pg_trgm.word_similarity_threshold = %s", (SEARCH_FUZZY_THRESHOLD,))
+    text_match = f"{PRODUCT_TSVECTOR} @@ q.tsq" if tsquery else "FALSE"
+    cur.execute(f"""
+        WITH q AS (
+            SELECT to_tsquery('english', %(tsquery)s) AS tsq, lower(%(raw)s) AS raw
+        ), hits AS (
+            SELECT p.product_id, p.product_name, p.category,
+                   CASE WHEN {text_match} THEN ts_rank_cd({PRODUCT_TSVECTOR}, q.tsq) ELSE 0 END
+                   {"+ word_similarity(q.raw, lower(p.product_name))" if fuzzy else ""} AS score
+            FROM products p, q
+            WHERE {text_match} {"OR q.raw <%% lower(p.product_name)" if fuzzy else ""}
+            ORDER BY score DESC, p.product_id
+            LIMIT %(limit)s
+        )
+        SELECT hits.product_id, hits.product_name, hits.category, round(hits.score::numeric, 4)::float AS score,
+               best.vendor_id AS best_vendor_id, best.vendor_name AS best_vendor_name,
+               best.website_url AS best_vendor_url, best.product_price AS best_price,
+               COALESCE(best.offers, 0) AS offers
+        FROM hits
+        LEFT JOIN LATERAL (
+            SELECT v.vendor_id, v.vendor_name, v.website_url, pp.product_price,
+                   count(*) OVER () AS offers
+            FROM product_prices pp JOIN vendors v ON v.vendor_id = pp.vendor_id
+            WHERE pp.product_id = hits.product_id
+            ORDER BY pp.product_price, v.vendor_id
+            LIMIT 1
+        ) best ON TRUE
+        ORDER BY hits.score DESC, best.product_price NULLS LAST, hits.product_id
+    """, {"tsquery": tsquery or "", "raw": " ".join(q.split()), "limit": limit})
+    return cur.fetchall()
@@ -0,0 +1,101 @@
+"""
+Active deals ranked by how much they save, kept in the deal_rankings table.
+Exports:
+ - refresh_rankings(cur, product_ids) -> re-ranks the deals of these products against their current prices
+ - rank_deal(cur, deal_id) -> ranks one deal; returns its ranking row, or None when it is not competitive
+ - rebuild_rankings(cur) -> re-ranks every deal (migrations run it once)
+ - prune_expired(cur) -> drops the rankings of deals that ended before today
+ - RANKING_SELECT -> SELECT list for the ranking columns (table alias r)
+
+A deal is ranked while it has not ended and its price beats every current
+listing of the product (product_price_summary.min_price). savings and
+discount_pct are measured against that best price; historical_low is the
+lowest price the product had in the last DEAL_HISTORY_DAYS days
+(price_history_hourly) or has now, and below_historical_low says whether the
+deal beats it. price_events re-ranks a product's deals whenever its prices
+change and add_deal ranks the new deal, inside the writer's transaction, so
+/deals pages through the table by savings instead of comparing every deal
+with the live prices on each request. Deals that have not started yet are
+ranked too; readers filter on start_date.
+
+Configuration (environment):
+ - DEAL_HISTORY_DAYS  lookback for historical_low, as of the last re-rank (default 90)
+"""
+import os
+
+DEAL_HISTORY_DAYS = int(os.environ.get("DEAL_HISTORY_DAYS", "90"))
+
+RANKING_SELECT = """
+    r.deal_id, r.product_id, r.vendor_id, r.deal_price, r.start_date, r.end_date,
+    r.best_price, r.vendor_price, r.historical_low, r.savings, r.discount_pct,
+    r.deal_price < r.historical_low AS below_historical_low, r.updated_at
+"""
+
+_RANK = """
+    SELECT d.deal_id, d.product_id, d.vendor_id, d.deal_price, d.start_date, d.end_date,
+           s.min_price AS best_price, pp.product_price AS vendor_price,
+           least(s.min_price, h.low) AS historical_low
+    FROM deals d
+    JOIN product_price_summary s ON s.product_id = d.product_id
+    LEFT JOIN product_prices pp ON pp.product_id = d.product_id AND pp.vendor_id = d.vendor_id
+    LEFT JOIN LATERAL (
+        SELECT min(hh.min_price) AS low FROM price_history_hourly hh
+        WHERE hh.product_id = d.product_id AND hh.bucket >= now() - make_interval(days => %(days)s)
+    ) h ON TRUE
+    WHERE d.end_date >= CURRENT_DATE AND d.deal_price < s.min_price {where}
+"""
+
+_UPSERT = """
+    INSERT INTO deal_rankings (deal_id, product_id, vendor_id, deal_price, start_date, end_date,
+                               best_price, vendor_price, historical_low, savings, discount_pct, updated_at)
+    SELECT deal_id, product_id, vendor_id, deal_price, start_date, end_date, best_price, vendor_price,
+           historical_low, round((best_price - deal_price)::numeric, 2)::float,
+           round(((best_price - deal_price) * 100 / NULLIF(best_price, 0))::numeric, 2)::float, now()
+    FROM ({rank}) fresh
+    ON CONFLICT (deal_id) DO UPDATE SET
+        deal_price = EXCLUDED.deal_price, start_date = EXCLUDED.start_date, end_date = EXCLUDED.end_date,
+        best_price = EXCLUDED.best_price, vendor_price = EXCLUDED.vendor_price,
+        historical_low = EXCLUDED.historical_low, savings = EXCLUDED.savings,
+        discount_pct = EXCLUDED.discount_pct, updated_at = EXCLUDED.updated_at
+    WHERE (deal_rankings.deal_price, deal_rankings.start_date, deal_rankings.end_date, deal_rankings.best_price,
+           deal_rankings.vendor_price, deal_rankings.historical_low)
+          IS DISTINCT FROM (EXCLUDED.deal_price, EXCLUDED.start_date, EXCLUDED.end_date, EXCLUDED.best_price,
+                            EXCLUDED.vendor_price, EXCLUDED.historical_low)
+"""
+
+# rankings whose deal no longer beats the best current price (or whose product lost every listing)
+_UNCOMPETITIVE = """
+    DELETE FROM deal_rankings r
+    WHERE NOT EXISTS (SELECT 1 FROM product_price_summary s
+                      WHERE s.product_id = r.product_id AND r.deal_price < s.min_price) {where}
+"""
+
+
+def prune_expired(cur):
+    cur.execute("DELETE FROM deal_rankings WHERE end_date < CURRENT_DATE")
+    return cur.rowcount
+
+
+def refresh_rankings(cur, product_ids):
+    """Re-rank the deals of product_ids from their current prices. Returns how many rankings changed."""
+    product_ids = sorted({p for p in product_ids if p is not None})
+    if not product_ids:
+        return 0
+    params = {"ids": product_ids, "days": DEAL_HISTORY_DAYS}
+    cur.execute(_UPSERT.format(rank=_RANK.format(where="AND d.product_id = ANY(%(ids)s)")), params)
+    changed = cur.rowcount
+    cur.execute(_UNCOMPETITIVE.format(where="AND r.product_id = ANY(%(ids)s)"), params)
+    return changed + cur.rowcount + prune_expired(cur)
+
+
+def rank_deal(cur, deal_id):
+    cur.execute(_UPSERT.format(rank=_RANK.format(where="AND d.deal_id = %(deal_id)s")),
+                {"deal_id": deal_id, "days": DEAL_HISTORY_DAYS})
+    cur.execute(f"SELECT {RANKING_SELECT} FROM deal_rankings r WHERE r.deal_id = %s", (deal_id,))
+    return cur.fetchone()
+
+
+def rebuild_rankings(cur):
+    cur.execute(_UPSERT.format(rank=_RANK.format(where="")), {"days": DEAL_HISTORY_DAYS})
+    cur.execute(_UNCOMPETITIVE.format(where=""))
+    prune_expired(cur)
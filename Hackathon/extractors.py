@@ -0,0 +1,171 @@
+"""
+Price extractors keyed by domain, shared by the requests and Playwright fetch paths.
+Exports:
+ - Extractor(name, domains, selectors) -> extractor with precompiled XPath expressions
+ - register(extractor) -> add (or replace) an extractor in the registry
+ - get_extractor(url) -> the extractor for a URL's domain (falls back to "generic")
+ - extract_price(html, url) -> (price|None, price_region_text|None)
+
+Every extractor checks structured data first (JSON-LD offers, then
+itemprop=price), then its own selectors in order, and stops at the first one
+that yields a number. Only when nothing matches is the page text searched,
+and then only for an amount next to a currency marker.
+"""
+import json
+import re
+
+from lxml import etree, html as lxml_html
+
+NUMBER_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+# "₹ 1,299", "Rs. 1,299.00", "INR 1299", "$19.99"
+CURRENCY_RE = re.compile(r'(?:₹|\brs\.?|\binr|\$|€|£)\s*(\d[\d,]*(?:\.\d+)?)', re.IGNORECASE)
+
+
+def _parse_number(text):
+    if text is None:
+        return None
+    m = NUMBER_RE.search(str(text).replace('\xa0', ' '))
+    if not m:
+        return None
+    try:
+        return float(m.group(0).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# XPath equivalents of the CSS selectors the fetchers used to carry inline
+def css_id(name):
+    return f"//*[@id='{name}']"
+
+
+def css_class(*names):
+    return "//*[" + " and ".join(_has_class(n) for n in names) + "]"
+
+
+JSON_LD = etree.XPath("//script[@type='application/ld+json']/text()")
+ITEMPROP_PRICE = etree.XPath("//*[@itemprop='price']")
+
+
+def _jsonld_price(tree):
+    for blob in JSON_LD(tree):
+        try:
+            data = json.loads(blob)
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                offers = node.get("offers")
+                if offers is not None:
+                    for offer in offers if isinstance(offers, list) else [offers]:
+                        if isinstance(offer, dict):
+                            for key in ("price", "lowPrice"):
+                                price = _parse_number(offer.get(key))
+                                if price is not None:
+                                    return price, str(offer.get(key))
+                stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+    return None, None
+
+
+def _itemprop_price(tree):
+    for el in ITEMPROP_PRICE(tree):
+        text = el.get("content") or el.text_content()
+        price = _parse_number(text)
+        if price is not None:
+            return price, text.strip()
+    return None, None
+
+
+class Extractor:
+    """A named list of XPath selectors, compiled once, for a set of domains.
+
+    domains are matched as substrings of the URL's host (e.g. "amazon.").
+    """
+
+    def __init__(self, name, domains, selectors, structured=True):
+        self.name = name
+        self.domains = tuple(domains)
+        self.selectors = [etree.XPath(s) for s in selectors]
+        self.structured = structured
+
+    def matches(self, domain):
+        return any(d in domain for d in self.domains)
+
+    def extract_tree(self, tree):
+        if self.structured:
+            for probe in (_jsonld_price, _itemprop_price):
+                price, region = probe(tree)
+                if price is not None:
+                    return price, region
+        for selector in self.selectors:
+            for el in selector(tree):
+                text = el if isinstance(el, str) else el.text_content()
+                price = _parse_number(text)
+                if price is not None:
+                    return price, text.strip()
+        # last resort: an amount next to a currency marker anywhere in the page
+        m = CURRENCY_RE.search(tree.text_content())
+        if m:
+            return _parse_number(m.group(1)), m.group(0)
+        return None, None
+
+    def extract(self, html):
+        if not html:
+            return None, None
+        try:
+            tree = lxml_html.fromstring(html)
+        except (etree.ParserError, ValueError):
+            return None, None
+        return self.extract_tree(tree)
+
+
+EXTRACTORS = {}
+
+
+def register(extractor):
+    EXTRACTORS[extractor.name] = extractor
+    return extractor
+
+
+def get_extractor(url):
+    from urllib.parse import urlparse
+
+    domain = urlparse(url).netloc.lower() if "//" in url else url.lower()
+    for extractor in EXTRACTORS.values():
+        if extractor.domains and extractor.matches(domain):
+            return extractor
+    return EXTRACTORS["generic"]
+
+
+def extract_price(html, url):
+    return get_extractor(url).extract(html)
+
+
+register(Extractor("amazon", ["amazon."], [
+    css_class("a-price") + "//*[" + _has_class("a-offscreen") + "]",
+    css_id("priceblock_ourprice"),
+    css_id("priceblock_dealprice"),
+    css_id("price_inside_buybox"),
+    css_class("a-color-price"),
+]))
+register(Extractor("flipkart", ["flipkart."], [
+    css_class("_30jeq3", "_16Jk6d"),
+    css_class("_1vC4OE"),
+]))
+register(Extractor("apple_hp", ["apple.", "hp."], [
+    css_class("price"),
+    css_class("product-price"),
+    css_class("offer-price"),
+]))
+register(Extractor("generic", [], [
+    "//meta[@itemprop='price']/@content",
+    "//*[contains(@class, 'price')]",
+    "//*[contains(@id, 'price')]",
+]))
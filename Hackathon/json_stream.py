@@ -0,0 +1,76 @@
+"""
+Streamed JSON responses for listings that can be arbitrarily large.
+Exports:
+ - dumps(obj) -> bytes, with orjson when it is installed and the json module otherwise
+ - stream_rows(query, params, fmt) -> generator of byte chunks: a JSON array ("json") or one object per line ("ndjson")
+ - CONTENT_TYPES -> response Content-Type per format
+
+Rows come from a server-side (named) cursor, itersize rows per round trip,
+and are encoded one at a time into chunks of about STREAM_CHUNK_BYTES, so a
+response holds one batch of rows and one chunk in memory however many rows
+it returns. The generator keeps its pooled connection until the last chunk
+has been sent (or the client goes away).
+
+Dates are written the way Flask's jsonify writes them (HTTP dates), so a
+streamed listing has the same shape as a paginated one.
+"""
+import json
+import os
+from datetime import date
+from decimal import Decimal
+
+from werkzeug.http import http_date
+
+from db import db_connection
+
+try:
+    import orjson  # optional, several times faster than json for row dicts
+except ImportError:
+    orjson = None
+
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", "65536"))
+STREAM_ITERSIZE = int(os.environ.get("STREAM_ITERSIZE", "2000"))
+CONTENT_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+def _default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def stream_rows(query, params=None, fmt="json", itersize=None):
+    """Run query on a named cursor and yield the rows as JSON chunks (bytes)."""
+    from psycopg2.extras import RealDictCursor
+
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"unknown stream format {fmt!r}")
+    first, separator, last = (b"[", b",", b"]") if fmt == "json" else (b"", b"\n", b"\n")
+    with db_connection() as conn:
+        cur = conn.cursor(name="json_stream", cursor_factory=RealDictCursor)
+        cur.itersize = itersize or STREAM_ITERSIZE
+        cur.execute(query, params)
+        chunk = bytearray(first)
+        empty = True
+        for row in cur:
+            if not empty:
+                chunk += separator
+            chunk += dumps(row)
+            empty = False
+            if len(chunk) >= STREAM_CHUNK_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+        cur.close()
+    if not (fmt == "ndjson" and empty):
+        chunk += last
+    yield bytes(chunk)
@@ -0,0 +1,433 @@
+"""
+In-process metrics in the Prometheus text format, plus an opt-in sampling profiler.
+Exports:
+ - counter(name, help, labels) / histogram(name, help, labels, buckets) -> registered metric (idempotent)
+ - collector(fn) -> registers fn() returning [(name, type, help, [(labels, value)])] evaluated on each scrape
+ - render() -> the text exposition of every metric
+ - time_route(endpoint, method, status, seconds) -> http_request_duration_seconds
+ - instrumented_connection() -> psycopg2 connection class that times every cursor's statements
+ - observe_fetch(domain, outcome, seconds, nbytes) / observe_refresh(report) -> fetch and refresh-cycle metrics
+ - serve(port) -> /metrics on a plain HTTP server thread (for processes without Flask)
+ - profiler -> Profiler (start/stop/collapsed stacks)
+
+Metrics live in the process that records them: every gunicorn worker and
+the standalone updater (`python -m price_fetcher worker`, which serves them
+on METRICS_PORT) is scraped on its own.
+
+SQL statements are labelled with their verb and first table ("select
+products", "insert product_prices") so the label set stays small however
+the queries are built.
+
+Configuration (environment):
+ - METRICS            set to 0 to stop recording (the endpoints stay up, empty)
+ - METRICS_PORT       port for serve() in the updater worker (default: off)
+ - PROFILER           set to 1 to allow the sampling profiler (toggled at /debug/profile)
+ - PROFILER_INTERVAL  seconds between stack samples (default 0.01)
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from functools import lru_cache
+
+METRICS = os.environ.get("METRICS", "1").lower() in ("true", "1", "t")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+PROFILER = os.environ.get("PROFILER", "0").lower() in ("true", "1", "t")
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", "0.01"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        if not METRICS:
+            return
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        if not METRICS:
+            return
+        with self.lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {k: list(v) for k, v in self.values.items()}
+        lines = []
+        for key, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {row[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def _register(cls, name, *args):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args)
+        return metric
+
+
+def counter(name, help, labels=()):
+    return _register(Counter, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def collector(fn):
+    """Register fn() -> [(name, type, help, [(labels_dict, value)])], called on every scrape."""
+    with _registry_lock:
+        if fn not in _collectors:
+            _collectors.append(fn)
+    return fn
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_registry.values())
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    for fn in collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {type(e).__name__}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- ROUTES ---
+http_requests = histogram("http_request_duration_seconds", "Time spent in Flask views.",
+                          ("endpoint", "method", "status"))
+
+
+def time_route(endpoint, method, status, seconds):
+    http_requests.observe(seconds, endpoint or "unmatched", method, str(status))
+
+
+# --- SQL ---
+sql_duration = histogram("db_query_duration_seconds", "Time spent executing SQL statements.",
+                         ("query",), SQL_BUCKETS)
+sql_rows = counter("db_query_rows_total", "Rows returned or affected by SQL statements.", ("query",))
+sql_errors = counter("db_query_errors_total", "SQL statements that raised.", ("query",))
+
+_COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_VERB = re.compile(r"\b(select|insert|update|delete|copy|create|alter|drop|truncate|set|listen|notify)\b", re.I)
+_TABLE = re.compile(r"\b(?:from|into|update|copy|table)\s+(?:if\s+(?:not\s+)?exists\s+)?(?:only\s+)?(?!\()([a-z_][\w.]*)",
+                    re.I)
+# INSERT/UPDATE/DELETE as statements, not "ON CONFLICT ... DO UPDATE"
+_WRITE = re.compile(r"(?<!do )\b(insert|update|delete)\b")
+
+
+# execute_values and bulk statements inline every row, so their text is large and different
+# every time: those are labelled from this much of either end and never cached
+LABEL_SCAN_CHARS = 1024
+
+
+def query_label(sql):
+    """'WITH data AS (...) INSERT INTO product_prices ...' -> 'insert product_prices'."""
+    large = len(sql) > 2 * LABEL_SCAN_CHARS
+    if large:
+        sql = sql[:LABEL_SCAN_CHARS], sql[-LABEL_SCAN_CHARS:]
+    else:
+        sql = (sql,)
+    text = " ".join(s.decode("utf-8", "replace") if isinstance(s, bytes) else s for s in sql)
+    return _label.__wrapped__(text) if large else _label(text)
+
+
+@lru_cache(maxsize=2048)
+def _label(sql):
+    text = _COMMENT.sub(" ", sql).strip().lower()
+    first = text.split(None, 1)[0] if text else "?"
+    verb = first
+    if first == "with":
+        # the statement a CTE chain feeds is its last top-level verb; the data-modifying ones count
+        writes = _WRITE.findall(text)
+        verb = writes[-1] if writes else "select"
+    elif not _VERB.match(first):
+        verb = first[:16]
+    table = None
+    if verb in ("insert", "update", "delete"):
+        match = re.search(rf"\b{verb}\s+(?:into\s+|from\s+)?([a-z_][\w.]*)", text)
+        table = match.group(1) if match else None
+    if table is None:
+        match = _TABLE.search(text)
+        table = match.group(1) if match else None
+    return f"{verb} {table}" if table else verb
+
+
+def _timed(method):
+    def run(self, query, *args, **kwargs):
+        if not METRICS:
+            return method(self, query, *args, **kwargs)
+        label = query_label(query) if isinstance(query, (str, bytes)) else "?"
+        started = time.perf_counter()
+        try:
+            return method(self, query, *args, **kwargs)
+        except Exception:
+            sql_errors.inc(label)
+            raise
+        finally:
+            sql_duration.observe(time.perf_counter() - started, label)
+            if self.rowcount and self.rowcount > 0:
+                sql_rows.inc(label, amount=self.rowcount)
+    run.__name__ = method.__name__
+    return run
+
+
+_instrumented_cursors = {}
+_instrumented_connection = None
+
+
+def _instrumented_cursor(base):
+    cls = _instrumented_cursors.get(base)
+    if cls is None:
+        cls = _instrumented_cursors[base] = type(f"Timed{base.__name__}", (base,), {
+            "execute": _timed(base.execute),
+            "executemany": _timed(base.executemany),
+            "copy_expert": _timed(base.copy_expert),
+        })
+    return cls
+
+
+def instrumented_connection():
+    """psycopg2 connection class whose cursors (plain, RealDictCursor, named) time every statement."""
+    global _instrumented_connection
+    if _instrumented_connection is None:
+        from psycopg2.extensions import connection, cursor
+
+        class InstrumentedConnection(connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.get("cursor_factory") or self.cursor_factory or cursor
+                kwargs["cursor_factory"] = _instrumented_cursor(base)
+                return super().cursor(*args, **kwargs)
+
+        _instrumented_connection = InstrumentedConnection
+    return _instrumented_connection
+
+
+# --- FETCHES AND REFRESH CYCLES ---
+fetch_duration = histogram("price_fetch_duration_seconds", "Time to fetch and parse one listing page.",
+                           ("domain",), FETCH_BUCKETS)
+fetch_outcomes = counter("price_fetch_total", "Listing fetches by domain and outcome (ok or the error).",
+                         ("domain", "outcome"))
+fetch_bytes = counter("price_fetch_bytes_total", "Response bytes downloaded per domain.", ("domain",))
+fetch_exceptions = counter("price_fetch_exceptions_total", "Unexpected exceptions inside a fetch backend.",
+                           ("exception",))
+refresh_duration = histogram("price_refresh_cycle_seconds", "Duration of refresh cycles that fetched something.",
+                             (), (1, 5, 10, 30, 60, 120, 300, 600))
+refresh_counts = counter("price_refresh_listings_total", "Listings handled by refresh cycles, by result.",
+                         ("result",))
+_last_refresh = {}
+
+
+def observe_fetch(domain, outcome, seconds=None, nbytes=0):
+    fetch_outcomes.inc(domain, outcome or "ok")
+    if seconds is not None:
+        fetch_duration.observe(seconds, domain)
+    if nbytes:
+        fetch_bytes.inc(domain, amount=nbytes)
+
+
+def observe_refresh(report):
+    """Record an update_all_prices() report."""
+    if not report.get("urls"):
+        return
+    refresh_duration.observe(report["duration"])
+    refresh_counts.inc("updated", amount=report["updated"])
+    refresh_counts.inc("changed", amount=report["changed"])
+    refresh_counts.inc("failed", amount=report["failed"])
+    _last_refresh.update({
+        "timestamp": time.time(),
+        "duration": report["duration"],
+        "urls_per_second": report["urls"] / report["duration"] if report["duration"] else 0.0,
+        "db_write": report["db_write"],
+    })
+
+
+@collector
+def refresh_gauges():
+    if not _last_refresh:
+        return []
+    return [
+        ("price_refresh_last_timestamp_seconds", "gauge", "When the last refresh cycle finished.",
+         [({}, round(_last_refresh["timestamp"], 3))]),
+        ("price_refresh_last_duration_seconds", "gauge", "Duration of the last refresh cycle.",
+         [({}, _last_refresh["duration"])]),
+        ("price_refresh_last_urls_per_second", "gauge", "Throughput of the last refresh cycle.",
+         [({}, round(_last_refresh["urls_per_second"], 2))]),
+        ("price_refresh_last_db_write_seconds", "gauge", "Database write time of the last refresh cycle.",
+         [({}, _last_refresh["db_write"])]),
+    ]
+
+
+# --- SAMPLING PROFILER ---
+class Profiler:
+    """Samples every thread's stack from a background thread while running.
+
+    Stacks are aggregated in the collapsed format flamegraph.pl and speedscope
+    read ("outer;inner;leaf count"), so the cost is one dict update per thread
+    per PROFILER_INTERVAL and nothing at all while stopped.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = _Tally()
+        self.samples = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, reset=True):
+        with self.lock:
+            if self.running:
+                return False
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            batch = []
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                batch.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(batch)
+                self.samples += 1
+
+    def collapsed(self, limit=None):
+        with self.lock:
+            items = self.stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self):
+        return {"enabled": PROFILER, "running": self.running, "samples": self.samples,
+                "stacks": len(self.stacks), "interval": self.interval, "started_at": self.started_at}
+
+
+profiler = Profiler()
+
+
+# --- STANDALONE ENDPOINT ---
+def serve(port=None):
+    """Serve GET /metrics from a daemon thread; for the updater worker, which runs no Flask app."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port or METRICS_PORT), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,392 @@
+"""
+Schema setup and versioned migrations. Run from build.sh (or by hand):
+    python migrations.py           # create base tables, then apply pending migrations
+    python migrations.py --status  # show applied and pending versions
+
+Each migration is a list of steps: plain SQL strings and callables taking a
+cursor run in one transaction; steps marked concurrent (see index()) run on
+an autocommit connection so indexes can be built with CREATE INDEX
+CONCURRENTLY without locking live tables.
+Applied versions are recorded in schema_migrations.
+"""
+import sys
+
+import psycopg2
+
+from db import DATABASE_URL
+from catalogue_search import PRODUCT_TSVECTOR
+
+# arbitrary key for pg_advisory_lock so two deploys never migrate at once
+MIGRATION_LOCK_KEY = 727_001
+# price history buckets with date_bin(), added in PostgreSQL 14
+MIN_SERVER_VERSION = 140000
+
+
+def create_tables(conn):
+    """Base schema. Safe to run repeatedly; everything added later lives in MIGRATIONS."""
+    cur = conn.cursor()
+
+    # Users table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            user_name VARCHAR(100) NOT NULL,
+            email VARCHAR(120) UNIQUE NOT NULL,
+            mobile_number VARCHAR(20),
+            address TEXT,
+            password_hash TEXT
+        );
+    """)
+
+    # Vendors table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS vendors (
+            vendor_id SERIAL PRIMARY KEY,
+            vendor_name VARCHAR(100) NOT NULL,
+            website_url TEXT
+        );
+    """)
+
+    # Products table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            product_id SERIAL PRIMARY KEY,
+            product_name VARCHAR(120) NOT NULL,
+            category VARCHAR(100)
+        );
+    """)
+
+    # Product Prices table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS product_prices (
+            price_id SERIAL PRIMARY KEY,
+            product_id INTEGER REFERENCES products(product_id),
+            vendor_id INTEGER REFERENCES vendors(vendor_id),
+            product_price FLOAT NOT NULL,
+            UNIQUE (product_id, vendor_id)
+        );
+    """)
+
+    # Alerts table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            alert_id SERIAL PRIMARY KEY,
+            user_id_reference INTEGER REFERENCES users(user_id),
+            product_id_reference INTEGER REFERENCES products(product_id),
+            price_alert FLOAT NOT NULL
+        );
+    """)
+
+    # Deals table
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS deals (
+            deal_id SERIAL PRIMARY KEY,
+            product_id INTEGER REFERENCES products(product_id),
+            vendor_id INTEGER REFERENCES vendors(vendor_id),
+            deal_price FLOAT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL
+        );
+    """)
+
+    conn.commit()
+    cur.close()
+
+
+def index(name, definition, unique=False):
+    """Step that builds an index concurrently (definition is "table (columns) [WHERE ...]").
+
+    A failed CONCURRENTLY build leaves an INVALID index behind that IF NOT EXISTS
+    would silently accept, so an invalid leftover is dropped and rebuilt.
+    """
+    def step(cur):
+        cur.execute("""
+            SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = %s AND c.relnamespace = 'public'::regnamespace
+        """, (name,))
+        row = cur.fetchone()
+        if row and row[0]:
+            return
+        if row:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}")
+    step.concurrent = True
+    step.description = f"index {name}"
+    return step
+
+
+def trigram_index(cur):
+    """Fuzzy-match index, only where the pg_trgm extension could be installed."""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cur.fetchone():
+        index("products_name_trgm_idx", "products USING gin (lower(product_name) gin_trgm_ops)")(cur)
+
+
+trigram_index.concurrent = True
+trigram_index.description = "index products_name_trgm_idx (if pg_trgm is available)"
+
+
+def partitions(cur):
+    from price_history import ensure_partitions
+    ensure_partitions(cur)
+
+
+def price_summaries(cur):
+    from price_summary import rebuild_summaries
+    rebuild_summaries(cur)
+
+
+def deal_rankings(cur):
+    from deal_ranking import rebuild_rankings
+    rebuild_rankings(cur)
+
+
+MIGRATIONS = [
+    (1, "unique product/vendor listings", [
+        # databases created before the constraint existed: keep the newest row per listing
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'product_prices_product_id_vendor_id_key') THEN
+                DELETE FROM product_prices a USING product_prices b
+                WHERE a.product_id = b.product_id AND a.vendor_id = b.vendor_id AND a.price_id < b.price_id;
+            END IF;
+        END $$;
+        """,
+        index("product_prices_product_id_vendor_id_key", "product_prices (product_id, vendor_id)", unique=True),
+        # attaching a prebuilt unique index only needs a brief lock
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'product_prices_product_id_vendor_id_key') THEN
+                ALTER TABLE product_prices ADD CONSTRAINT product_prices_product_id_vendor_id_key
+                    UNIQUE USING INDEX product_prices_product_id_vendor_id_key;
+            END IF;
+        END $$;
+        """,
+    ]),
+    (2, "indexes for hot lookups", [
+        index("product_prices_vendor_id_idx", "product_prices (vendor_id)"),
+        index("alerts_user_id_idx", "alerts (user_id_reference)"),
+        index("alerts_product_price_idx", "alerts (product_id_reference, price_alert)"),
+        index("users_user_name_idx", "users (user_name, user_id)"),
+        index("vendors_vendor_name_idx", "vendors (vendor_name, vendor_id)"),
+        index("products_name_idx", "products (product_name, product_id)"),
+        index("products_category_idx", "products (category)"),
+        index("deals_end_date_idx", "deals (end_date, start_date)"),
+        index("deals_product_vendor_idx", "deals (product_id, vendor_id)"),
+    ]),
+    (3, "alert triggers", [
+        """
+        CREATE TABLE IF NOT EXISTS alert_triggers (
+            trigger_id BIGSERIAL PRIMARY KEY,
+            alert_id INTEGER NOT NULL REFERENCES alerts(alert_id) ON DELETE CASCADE,
+            product_id INTEGER NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+            vendor_id INTEGER NOT NULL REFERENCES vendors(vendor_id) ON DELETE CASCADE,
+            price FLOAT NOT NULL,
+            previous_price FLOAT,
+            triggered_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS alert_triggers_alert_idx ON alert_triggers (alert_id, triggered_at DESC)",
+        "CREATE INDEX IF NOT EXISTS alert_triggers_vendor_idx ON alert_triggers (vendor_id)",
+        "CREATE INDEX IF NOT EXISTS alert_triggers_product_idx ON alert_triggers (product_id)",
+    ]),
+    (4, "price history", [
+        # change-only points, partitioned by month (price_history.ensure_partitions adds new months)
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            product_id INTEGER NOT NULL,
+            vendor_id INTEGER NOT NULL,
+            price FLOAT NOT NULL,
+            recorded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        ) PARTITION BY RANGE (recorded_at);
+        """,
+        "CREATE INDEX IF NOT EXISTS price_history_listing_idx ON price_history (product_id, vendor_id, recorded_at)",
+        # hourly min/max/last rollup that range queries read instead of the raw points
+        """
+        CREATE TABLE IF NOT EXISTS price_history_hourly (
+            product_id INTEGER NOT NULL,
+            vendor_id INTEGER NOT NULL,
+            bucket TIMESTAMPTZ NOT NULL,
+            min_price FLOAT NOT NULL,
+            max_price FLOAT NOT NULL,
+            last_price FLOAT NOT NULL,
+            last_at TIMESTAMPTZ NOT NULL,
+            points INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (product_id, vendor_id, bucket)
+        );
+        """,
+        partitions,
+    ]),
+    (5, "refresh schedule", [
+        # one row per listing; scheduler.py adapts interval_seconds to how often the price moves
+        """
+        CREATE TABLE IF NOT EXISTS refresh_schedule (
+            product_id INTEGER NOT NULL,
+            vendor_id INTEGER NOT NULL,
+            interval_seconds INTEGER NOT NULL,
+            next_due TIMESTAMPTZ NOT NULL DEFAULT now(),
+            failures INTEGER NOT NULL DEFAULT 0,
+            last_checked_at TIMESTAMPTZ,
+            last_changed_at TIMESTAMPTZ,
+            PRIMARY KEY (product_id, vendor_id),
+            FOREIGN KEY (product_id, vendor_id) REFERENCES product_prices (product_id, vendor_id) ON DELETE CASCADE
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS refresh_schedule_next_due_idx ON refresh_schedule (next_due)",
+    ]),
+    (6, "fetch failure reasons", [
+        # why the last refresh of a listing failed (timeout, http_503, circuit_open, ...)
+        "ALTER TABLE refresh_schedule ADD COLUMN IF NOT EXISTS last_error TEXT",
+    ]),
+    (7, "response cache generations", [
+        # bumped by cache.invalidate() in every write that changes a cached response
+        """
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            tag TEXT PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0
+        );
+        """,
+    ]),
+    (8, "catalogue search", [
+        # trigram matching is optional: not every Postgres ships the extension
+        """
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'pg_trgm is not available, catalogue search runs without typo tolerance';
+        END $$;
+        """,
+        index("products_search_idx", f"products USING gin ({PRODUCT_TSVECTOR})"),
+        trigram_index,
+    ]),
+    (9, "price summary", [
+        # best offer per product, maintained by price_summary.refresh_summaries()
+        """
+        CREATE TABLE IF NOT EXISTS product_price_summary (
+            product_id INTEGER PRIMARY KEY REFERENCES products (product_id) ON DELETE CASCADE,
+            min_price FLOAT NOT NULL,
+            max_price FLOAT NOT NULL,
+            best_vendor_id INTEGER NOT NULL,
+            vendor_count INTEGER NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS product_price_summary_vendor_idx ON product_price_summary (best_vendor_id)",
+        price_summaries,
+    ]),
+    (10, "password hashes", [
+        # register used to add this on every signup; databases from before it have no such column
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS password_hash TEXT",
+    ]),
+    (11, "deal rankings", [
+        # competitive active deals and their savings, maintained by deal_ranking.refresh_rankings()
+        """
+        CREATE TABLE IF NOT EXISTS deal_rankings (
+            deal_id INTEGER PRIMARY KEY REFERENCES deals (deal_id) ON DELETE CASCADE,
+            product_id INTEGER NOT NULL,
+            vendor_id INTEGER NOT NULL,
+            deal_price FLOAT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            best_price FLOAT NOT NULL,
+            vendor_price FLOAT,
+            historical_low FLOAT NOT NULL,
+            savings FLOAT NOT NULL,
+            discount_pct FLOAT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS deal_rankings_savings_idx ON deal_rankings (savings DESC, deal_id DESC)",
+        "CREATE INDEX IF NOT EXISTS deal_rankings_product_idx ON deal_rankings (product_id)",
+        "CREATE INDEX IF NOT EXISTS deal_rankings_end_date_idx ON deal_rankings (end_date)",
+        deal_rankings,
+    ]),
+    (12, "price history default partition", [
+        # catches points for a month without a partition; ensure_partitions moves them out again
+        "CREATE TABLE IF NOT EXISTS price_history_default PARTITION OF price_history DEFAULT",
+    ]),
+]
+
+
+def connect():
+    return psycopg2.connect(DATABASE_URL)
+
+
+def applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cur.fetchall()}
+
+
+def migrate(verbose=True):
+    """Create the base tables and apply every pending migration in order."""
+    conn = connect()
+    if conn.server_version < MIN_SERVER_VERSION:
+        conn.close()
+        raise RuntimeError(f"PostgreSQL 14 or newer is required (server is {conn.server_version})")
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.autocommit = False
+        create_tables(conn)
+        cur = conn.cursor()
+        done = applied_versions(cur)
+        conn.commit()
+        for version, name, steps in MIGRATIONS:
+            if version in done:
+                continue
+            if verbose:
+                print(f"Applying migration {version}: {name}")
+            for step in steps:
+                if getattr(step, "concurrent", False):
+                    # CREATE INDEX CONCURRENTLY refuses to run inside a transaction block,
+                    # so earlier steps are committed first (every step is idempotent)
+                    conn.commit()
+                    conn.autocommit = True
+                    if verbose:
+                        print(f"  {step.description}")
+                    step(cur)
+                    conn.autocommit = False
+                elif callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            conn.commit()
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        cur.close()
+        conn.close()
+
+
+def status():
+    conn = connect()
+    cur = conn.cursor()
+    done = applied_versions(cur)
+    conn.commit()
+    cur.close()
+    conn.close()
+    for version, name, _ in MIGRATIONS:
+        print(f"{version:>4}  {'applied' if version in done else 'pending'}  {name}")
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv[1:]:
+        status()
+    else:
+        print("Migrating database schema...")
+        migrate()
+        print("Database schema is up to date.")
@@ -0,0 +1,35 @@
+"""
+Single hook for everything derived from product_prices.
+Exports:
+ - on_prices_changed(cur, changes, stale, alert_index=None) -> dict of counts; adds stale cache tags to `stale`
+
+Every code path that writes prices (the refresh, product edits) passes the
+changed listings returned by db.upsert_prices here, inside the same
+transaction, so history, alerts, price summaries, deal rankings and cached
+responses never drift from the prices themselves. Cache tags are only
+collected here: the caller bumps them once with cache.invalidate() right
+before it commits, so the cache_generations rows stay locked for the commit
+alone rather than for the rest of the write.
+"""
+from alert_engine import evaluate_alerts
+from deal_ranking import refresh_rankings
+from price_history import record_changes
+from price_summary import refresh_summaries
+
+
+def on_prices_changed(cur, changes, stale, alert_index=None):
+    """changes: (product_id, vendor_id, old_price, new_price) tuples; stale: set of cache tags."""
+    if not changes:
+        return {"history_points": 0, "alerts_triggered": 0, "summaries_changed": 0, "deals_reranked": 0}
+    # /products and /api/track-products embed prices
+    stale.add("products")
+    product_ids = {c[0] for c in changes}
+    report = {
+        "summaries_changed": refresh_summaries(cur, product_ids),
+        "history_points": record_changes(cur, changes),
+        "alerts_triggered": evaluate_alerts(cur, changes, index=alert_index),
+    }
+    report["deals_reranked"] = refresh_rankings(cur, product_ids)
+    if report["deals_reranked"]:
+        stale.add("deals")
+    return report
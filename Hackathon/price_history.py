@@ -0,0 +1,159 @@
+"""
+Append-only price history with an hourly rollup for range queries.
+Exports:
+ - record_changes(cur, changes) -> appends changed prices to price_history and the hourly rollup
+ - ensure_partitions(cur, when) -> creates the monthly price_history partitions around `when`
+ - history_series(cur, product_id, start, end, buckets, vendor_id=None) -> downsampled min/max/last series
+
+Only price changes are stored (upsert_prices already filters out unchanged
+listings), so a listing's price at time t is the last point at or before t.
+Range queries read price_history_hourly, never the raw points: the hourly
+buckets are merged into the requested bucket width in SQL and values are
+carried forward across buckets without a change.
+
+price_history is partitioned by month; a DEFAULT partition catches points for
+a month whose partition is missing, so a write never fails on it. Bucketing
+uses date_bin(), which needs PostgreSQL 14 or newer (migrations.py checks).
+"""
+from datetime import datetime, timedelta, timezone
+
+# serialises the processes that create a month's partition (see ensure_partitions)
+PARTITION_LOCK_KEY = 727_003
+
+
+def _month_start(when):
+    return datetime(when.year, when.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(start):
+    return datetime(start.year + (start.month == 12), start.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _existing(cur, names):
+    cur.execute("SELECT " + ", ".join(f"to_regclass(%s) IS NOT NULL AS e{i}" for i in range(len(names))), names)
+    row = cur.fetchone()
+    return list(row.values()) if isinstance(row, dict) else list(row)
+
+
+def ensure_partitions(cur, when=None):
+    """Create the partitions for the month of `when` and the month after (idempotent).
+
+    Whether a partition exists is asked of the database on every call, not
+    remembered per process, so one created by a transaction that was rolled
+    back is simply created again. Points that landed in price_history_default
+    for that month in the meantime are moved into the new partition.
+    """
+    when = when or datetime.now(timezone.utc)
+    start = _month_start(when)
+    months = [(month, f"price_history_y{month.year}m{month.month:02d}") for month in (start, _next_month(start))]
+    missing = [m for m, exists in zip(months, _existing(cur, [name for _, name in months])) if not exists]
+    if not missing:
+        return
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (PARTITION_LOCK_KEY,))
+    has_default = _existing(cur, ["price_history_default"])[0]
+    for month, name in missing:
+        if _existing(cur, [name])[0]:
+            continue
+        end = _next_month(month)
+        cur.execute(f"CREATE TABLE {name} (LIKE price_history INCLUDING DEFAULTS)")
+        if has_default:
+            cur.execute(f"""
+                WITH moved AS (
+                    DELETE FROM price_history_default WHERE recorded_at >= %s AND recorded_at < %s
+                    RETURNING product_id, vendor_id, price, recorded_at
+                )
+                INSERT INTO {name} (product_id, vendor_id, price, recorded_at) SELECT * FROM moved
+            """, (month, end))
+        cur.execute(f"ALTER TABLE price_history ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (month, end))
+
+
+def record_changes(cur, changes):
+    """Store (product_id, vendor_id, old_price, new_price) changes. Returns the number of points written."""
+    from psycopg2.extras import execute_values
+
+    points = [(p, v, new) for p, v, _, new in changes if new is not None]
+    if not points:
+        return 0
+    ensure_partitions(cur)
+    execute_values(cur, """
+        WITH data AS (
+            SELECT d.product_id::int AS product_id, d.vendor_id::int AS vendor_id, d.price::float8 AS price
+            FROM (VALUES %s) AS d(product_id, vendor_id, price)
+        ), raw AS (
+            INSERT INTO price_history (product_id, vendor_id, price, recorded_at)
+            SELECT product_id, vendor_id, price, now() FROM data
+        )
+        INSERT INTO price_history_hourly AS h
+            (product_id, vendor_id, bucket, min_price, max_price, last_price, last_at, points)
+        SELECT product_id, vendor_id, date_bin('1 hour', now(), TIMESTAMPTZ '2000-01-01 00:00+00'), price, price, price, now(), 1 FROM data
+        ON CONFLICT (product_id, vendor_id, bucket) DO UPDATE SET
+            min_price = LEAST(h.min_price, EXCLUDED.min_price),
+            max_price = GREATEST(h.max_price, EXCLUDED.max_price),
+            last_price = EXCLUDED.last_price,
+            last_at = EXCLUDED.last_at,
+            points = h.points + 1
+    """, points)
+    return len(points)
+
+
+def history_series(cur, product_id, start, end, buckets=100, vendor_id=None):
+    """Downsampled history for one product between start and end (aware datetimes).
+
+    Returns {vendor_id: {"lowest": float|None, "points": [{"t", "min", "max", "last"}]}}
+    with exactly `buckets` evenly sized points per vendor; buckets before the
+    first known price are omitted. cur must be a RealDictCursor.
+    """
+    buckets = max(1, buckets)
+    width = max(timedelta(hours=1), (end - start) / buckets)
+    width = timedelta(seconds=int(width.total_seconds()))
+    origin = start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    vendor_filter = "AND vendor_id = %(vendor_id)s" if vendor_id else ""
+    params = {"product_id": product_id, "vendor_id": vendor_id, "origin": origin, "end": end,
+              "width": width}
+
+    # price in effect when the range starts: the last rollup bucket before it
+    cur.execute(f"""
+        SELECT DISTINCT ON (vendor_id) vendor_id, last_price
+        FROM price_history_hourly
+        WHERE product_id = %(product_id)s {vendor_filter} AND bucket < %(origin)s
+        ORDER BY vendor_id, bucket DESC
+    """, params)
+    carry = {r['vendor_id']: r['last_price'] for r in cur.fetchall()}
+
+    cur.execute(f"""
+        SELECT vendor_id, date_bin(%(width)s, bucket, %(origin)s) AS t,
+               MIN(min_price) AS min, MAX(max_price) AS max,
+               (array_agg(last_price ORDER BY last_at DESC))[1] AS last
+        FROM price_history_hourly
+        WHERE product_id = %(product_id)s {vendor_filter}
+          AND bucket >= %(origin)s AND bucket < %(end)s
+        GROUP BY vendor_id, t
+        ORDER BY vendor_id, t
+    """, params)
+    by_vendor = {}
+    for r in cur.fetchall():
+        by_vendor.setdefault(r['vendor_id'], {})[r['t']] = r
+
+    series = {}
+    for vid in sorted(set(carry) | set(by_vendor)):
+        last = carry.get(vid)
+        rows = by_vendor.get(vid, {})
+        points = []
+        for i in range(buckets):
+            t = origin + width * i
+            if t >= end:
+                break
+            r = rows.get(t)
+            if r is not None:
+                # the price carried into the bucket also counts towards its min/max
+                lo = r['min'] if last is None else min(last, r['min'])
+                hi = r['max'] if last is None else max(last, r['max'])
+                last = r['last']
+                points.append({"t": t.isoformat(), "min": lo, "max": hi, "last": last})
+            elif last is not None:
+                points.append({"t": t.isoformat(), "min": last, "max": last, "last": last})
+        series[vid] = {
+            "lowest": min((p["min"] for p in points), default=None),
+            "points": points,
+        }
+    return series
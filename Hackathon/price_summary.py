@@ -0,0 +1,67 @@
+"""
+Per-product price summary kept in the product_price_summary table.
+Exports:
+ - refresh_summaries(cur, product_ids) -> recomputes the summary rows of these products
+ - rebuild_summaries(cur) -> recomputes every row (migrations run it once)
+ - SUMMARY_SELECT -> SELECT list for the summary columns plus the best vendor's name and website
+
+One row per product that has at least one listing: lowest and highest
+current price, the vendor with the lowest price (lowest vendor_id on a tie),
+the number of vendors and when the summary last changed. price_events and
+the write paths that delete listings call refresh_summaries inside their own
+transaction, so reading a product's best offer is a primary key lookup
+instead of an aggregate over all of its listings.
+"""
+
+SUMMARY_SELECT = """
+    s.min_price, s.max_price, s.best_vendor_id, bv.vendor_name AS best_vendor_name,
+    bv.website_url AS best_vendor_website, s.vendor_count, s.updated_at
+"""
+
+_SUMMARIZE = """
+    SELECT pp.product_id, min(pp.product_price) AS min_price, max(pp.product_price) AS max_price,
+           (array_agg(pp.vendor_id ORDER BY pp.product_price, pp.vendor_id))[1] AS best_vendor_id,
+           count(*) AS vendor_count
+    FROM product_prices pp
+    WHERE pp.product_id IS NOT NULL AND pp.vendor_id IS NOT NULL {where}
+    GROUP BY pp.product_id
+"""
+
+_UPSERT = """
+    INSERT INTO product_price_summary (product_id, min_price, max_price, best_vendor_id, vendor_count, updated_at)
+    SELECT product_id, min_price, max_price, best_vendor_id, vendor_count, now() FROM ({summarize}) fresh
+    ON CONFLICT (product_id) DO UPDATE SET
+        min_price = EXCLUDED.min_price, max_price = EXCLUDED.max_price,
+        best_vendor_id = EXCLUDED.best_vendor_id, vendor_count = EXCLUDED.vendor_count,
+        updated_at = EXCLUDED.updated_at
+    WHERE (product_price_summary.min_price, product_price_summary.max_price,
+           product_price_summary.best_vendor_id, product_price_summary.vendor_count)
+          IS DISTINCT FROM (EXCLUDED.min_price, EXCLUDED.max_price, EXCLUDED.best_vendor_id, EXCLUDED.vendor_count)
+"""
+
+
+def refresh_summaries(cur, product_ids):
+    """Recompute the summaries of product_ids from their current listings. Returns how many rows changed."""
+    product_ids = sorted({p for p in product_ids if p is not None})
+    if not product_ids:
+        return 0
+    cur.execute(_UPSERT.format(summarize=_SUMMARIZE.format(where="AND pp.product_id = ANY(%(ids)s)")),
+                {"ids": product_ids})
+    changed = cur.rowcount
+    # products whose last listing went away
+    cur.execute("""
+        DELETE FROM product_price_summary s
+        WHERE s.product_id = ANY(%(ids)s)
+          AND NOT EXISTS (SELECT 1 FROM product_prices pp
+                          WHERE pp.product_id = s.product_id AND pp.vendor_id IS NOT NULL)
+    """, {"ids": product_ids})
+    return changed + cur.rowcount
+
+
+def rebuild_summaries(cur):
+    cur.execute(_UPSERT.format(summarize=_SUMMARIZE.format(where="")))
+    cur.execute("""
+        DELETE FROM product_price_summary s
+        WHERE NOT EXISTS (SELECT 1 FROM product_prices pp
+                          WHERE pp.product_id = s.product_id AND pp.vendor_id IS NOT NULL)
+    """)
@@ -0,0 +1,145 @@
+"""
+Per-listing refresh schedule kept in the refresh_schedule table.
+Exports:
+ - sync_schedule(cur) -> adds a row (due now) for every listing that has none yet
+ - due_listings(cur, limit) -> the (product_id, vendor_id, website_url) rows due for a refresh, most overdue first
+ - reschedule(cur, outcomes) -> sets the next due time (and last error) from each listing's refresh outcome
+ - watch_products(cur, product_ids) -> pulls watched listings forward when an alert is created
+ - schedule_stats(cur) -> queue depth, lag, interval spread and failing listings by error
+
+Every listing carries its own interval. A refresh that finds a new price
+halves it, an unchanged price doubles it (REFRESH_BACKOFF), both clamped to
+[REFRESH_MIN_INTERVAL, REFRESH_MAX_INTERVAL]; listings with a price alert are
+never left longer than REFRESH_WATCHED_MAX_INTERVAL. A failed fetch keeps the
+interval but backs off exponentially with the number of consecutive failures.
+Next due times get +-10% jitter so listings added together drift apart.
+
+Configuration (environment, seconds):
+ - PRICE_UPDATE_INTERVAL          starting interval for new listings (default 300)
+ - REFRESH_MIN_INTERVAL           fastest a volatile listing is refreshed (default 120)
+ - REFRESH_MAX_INTERVAL           slowest a stable listing is refreshed (default 21600)
+ - REFRESH_WATCHED_MAX_INTERVAL   cap for listings with an alert (default 900)
+ - REFRESH_BACKOFF                multiplier after an unchanged refresh (default 2)
+"""
+import os
+
+REFRESH_BASE_INTERVAL = int(os.environ.get("PRICE_UPDATE_INTERVAL", "300"))
+REFRESH_MIN_INTERVAL = int(os.environ.get("REFRESH_MIN_INTERVAL", "120"))
+REFRESH_MAX_INTERVAL = int(os.environ.get("REFRESH_MAX_INTERVAL", "21600"))
+REFRESH_WATCHED_MAX_INTERVAL = int(os.environ.get("REFRESH_WATCHED_MAX_INTERVAL", "900"))
+REFRESH_BACKOFF = float(os.environ.get("REFRESH_BACKOFF", "2"))
+
+# refresh outcomes passed to reschedule()
+CHANGED, UNCHANGED, FAILED, SKIPPED = "changed", "unchanged", "failed", "skipped"
+
+
+def sync_schedule(cur):
+    """Schedule listings that appeared since the last call. Returns how many were added.
+
+    Rows disappear on their own: refresh_schedule references product_prices ON DELETE CASCADE.
+    """
+    cur.execute(f"""
+        INSERT INTO refresh_schedule (product_id, vendor_id, interval_seconds, next_due)
+        SELECT pp.product_id, pp.vendor_id,
+               CASE WHEN EXISTS (SELECT 1 FROM alerts a WHERE a.product_id_reference = pp.product_id)
+                    THEN LEAST({REFRESH_BASE_INTERVAL}, {REFRESH_WATCHED_MAX_INTERVAL})
+                    ELSE {REFRESH_BASE_INTERVAL} END,
+               now()
+        FROM product_prices pp
+        WHERE pp.product_id IS NOT NULL AND pp.vendor_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM refresh_schedule s
+                          WHERE s.product_id = pp.product_id AND s.vendor_id = pp.vendor_id)
+        ON CONFLICT (product_id, vendor_id) DO NOTHING
+    """)
+    return cur.rowcount
+
+
+def due_listings(cur, limit=None):
+    cur.execute("""
+        SELECT s.product_id, s.vendor_id, v.website_url
+        FROM refresh_schedule s JOIN vendors v ON v.vendor_id = s.vendor_id
+        WHERE s.next_due <= now()
+        ORDER BY s.next_due
+        LIMIT %s
+    """, (limit,))
+    return cur.fetchall()
+
+
+def reschedule(cur, outcomes):
+    """outcomes: iterable of (product_id, vendor_id, outcome[, error]) with outcome one of
+    CHANGED/UNCHANGED/FAILED/SKIPPED; error is the fetch error recorded for FAILED listings."""
+    from psycopg2.extras import execute_values
+
+    outcomes = [(o[0], o[1], o[2], o[3] if len(o) > 3 else None) for o in outcomes]
+    if not outcomes:
+        return 0
+    execute_values(cur, f"""
+        WITH data AS (
+            SELECT d.product_id::int AS product_id, d.vendor_id::int AS vendor_id,
+                   d.outcome::text AS outcome, d.error::text AS error
+            FROM (VALUES %s) AS d(product_id, vendor_id, outcome, error)
+        ), next AS (
+            SELECT data.product_id, data.vendor_id, data.outcome, data.error,
+                   LEAST(
+                       CASE WHEN EXISTS (SELECT 1 FROM alerts a WHERE a.product_id_reference = data.product_id)
+                            THEN {REFRESH_WATCHED_MAX_INTERVAL} ELSE {REFRESH_MAX_INTERVAL} END,
+                       GREATEST({REFRESH_MIN_INTERVAL}, CASE data.outcome
+                           WHEN '{CHANGED}' THEN s.interval_seconds / 2
+                           WHEN '{UNCHANGED}' THEN (s.interval_seconds * {REFRESH_BACKOFF})::int
+                           ELSE s.interval_seconds END)
+                   ) AS interval_seconds
+            FROM data JOIN refresh_schedule s USING (product_id, vendor_id)
+        )
+        UPDATE refresh_schedule s SET
+            interval_seconds = next.interval_seconds,
+            failures = CASE WHEN next.outcome = '{FAILED}' THEN s.failures + 1 ELSE 0 END,
+            last_error = CASE WHEN next.outcome = '{FAILED}' THEN next.error
+                              WHEN next.outcome = '{SKIPPED}' THEN 'no_url' END,
+            last_checked_at = now(),
+            last_changed_at = CASE WHEN next.outcome = '{CHANGED}' THEN now() ELSE s.last_changed_at END,
+            next_due = now() + make_interval(secs => CASE next.outcome
+                WHEN '{FAILED}' THEN LEAST({REFRESH_MAX_INTERVAL}, {REFRESH_MIN_INTERVAL} * power(2, LEAST(s.failures, 16)))
+                WHEN '{SKIPPED}' THEN {REFRESH_MAX_INTERVAL}
+                ELSE next.interval_seconds END * (0.9 + random() * 0.2))
+        FROM next
+        WHERE s.product_id = next.product_id AND s.vendor_id = next.vendor_id
+    """, outcomes, page_size=5000)
+    return len(outcomes)
+
+
+def watch_products(cur, product_ids):
+    """A new alert means someone is waiting on these listings: refresh them within the watched cap."""
+    cur.execute(f"""
+        UPDATE refresh_schedule SET
+            interval_seconds = LEAST(interval_seconds, {REFRESH_WATCHED_MAX_INTERVAL}),
+            next_due = LEAST(next_due, now() + make_interval(secs => {REFRESH_WATCHED_MAX_INTERVAL}))
+        WHERE product_id = ANY(%s)
+    """, (list(product_ids),))
+
+
+def schedule_stats(cur):
+    """Queue depth (listings due now), lag (how overdue the oldest one is) and the interval spread."""
+    cur.execute("""
+        SELECT count(*),
+               count(*) FILTER (WHERE next_due <= now()),
+               COALESCE(EXTRACT(EPOCH FROM now() - min(next_due) FILTER (WHERE next_due <= now())), 0),
+               GREATEST(0, COALESCE(EXTRACT(EPOCH FROM min(next_due) - now()), 0)),
+               count(*) FILTER (WHERE failures > 0),
+               percentile_disc(ARRAY[0.1, 0.5, 0.9]) WITHIN GROUP (ORDER BY interval_seconds)
+        FROM refresh_schedule
+    """)
+    total, due, lag, next_due_in, failing, spread = cur.fetchone()
+    cur.execute("""
+        SELECT COALESCE(last_error, 'unknown'), count(*) FROM refresh_schedule
+        WHERE failures > 0 GROUP BY 1 ORDER BY 2 DESC
+    """)
+    errors = dict(cur.fetchall())
+    return {
+        "listings": total,
+        "due": due,
+        "lag_seconds": round(float(lag), 1),
+        "next_due_in": round(float(next_due_in), 1),
+        "failing": failing,
+        "errors": errors,
+        "interval_p10_p50_p90": spread or [],
+    }
@@ -2,6 +2,34 @@ document.addEventListener('DOMContentLoaded', function(){
   const form = document.getElementById('searchForm');
   const input = document.getElementById('searchQuery');
   const out = document.getElementById('searchResults');
+  const POLL_INTERVAL_MS = 1000;
+  const MAX_POLLS = 30;
+  let currentQuery = null;
+
+  function priceText(r){
+    if (r.pending) return '<em>Fetching…</em>';
+    return r.price===null ? '<em>Not found</em>' : '₹'+r.price;
+  }
+
+  // matches from our own catalogue, with the cheapest vendor for each
+  function renderProducts(q, products){
+    let html = '<div class="row">';
+    products.forEach(p => {
+      const price = p.best_price===null ? '<em>No price yet</em>' : '₹'+p.best_price;
+      const vendor = p.best_vendor_name ? ` at ${p.best_vendor_name}` : '';
+      const link = p.best_vendor_url ? `<a href="${p.best_vendor_url}" target="_blank" class="btn btn-sm btn-primary">Open ${p.best_vendor_name}</a>` : '';
+      html += `<div class="col-md-4"><div class="card mb-3">
+        <div class="card-body">
+          <h5 class="card-title">${p.product_name}</h5>
+          <h6 class="card-subtitle mb-2 text-muted">${p.category || ''}</h6>
+          <p class="card-text">Best price: ${price}${vendor} (${p.offers} offer${p.offers===1 ? '' : 's'})</p>
+          ${link}
+        </div></div></div>`;
+    });
+    html += '</div><button id="searchShops" class="btn btn-sm btn-outline-secondary">Check live prices in shops</button>';
+    out.innerHTML = html;
+    document.getElementById('searchShops').addEventListener('click', () => load(q, 0, 'external'));
+  }
 
   function render(results){
     if(!results || results.length===0){ out.innerHTML = '<p>No results</p>'; return; }
@@ -10,7 +38,7 @@ document.addEventListener('DOMContentLoaded', function(){
       html += `<div class="col-md-4"><div class="card mb-3">
         <div class="card-body">
           <h5 class="card-title">${r.platform}</h5>
-          <p class="card-text">Price: ${r.price===null ? '<em>Not found</em>' : '₹'+r.price}</p>
+          <p class="card-text">Price: ${priceText(r)}</p>
           <a href="${r.url}" target="_blank" class="btn btn-sm btn-primary">Open ${r.platform}</a>
         </div></div></div>`;
     });
@@ -18,14 +46,29 @@ document.addEventListener('DOMContentLoaded', function(){
     out.innerHTML = html;
   }
 
+  // local catalogue matches answer at once; otherwise async mode answers straight away
+  // with cached/partial shop results and we keep polling until complete
+  function load(q, polls, source){
+    const sourceArg = source ? `&source=${source}` : '';
+    fetch(`/search?mode=async&q=${encodeURIComponent(q)}${sourceArg}`)
+      .then(r => r.json())
+      .then(res => {
+        if (q !== currentQuery) return;
+        if (res.source === 'local') { renderProducts(q, res.products || []); return; }
+        render(res.results || []);
+        if (!res.complete && polls < MAX_POLLS) {
+          setTimeout(() => load(q, polls + 1, 'external'), POLL_INTERVAL_MS);
+        }
+      })
+      .catch(()=> out.innerHTML = '<div class="alert alert-danger">Search failed</div>');
+  }
+
   form.addEventListener('submit', function(e){
     e.preventDefault();
     const q = input.value.trim();
     if(!q) return;
+    currentQuery = q;
     out.innerHTML = '<div class="spinner-border" role="status"><span class="sr-only">Loading...</span></div>';
-    fetch(`/search?q=${encodeURIComponent(q)}`)
-      .then(r => r.json())
-      .then(res => render(res.results || []))
-      .catch(()=> out.innerHTML = '<div class="alert alert-danger">Search failed</div>');
+    load(q, 0);
   });
-});
\ No newline at end of file
+});
@@ -3,6 +3,20 @@ document.addEventListener("DOMContentLoaded", function(){
   console.log("Custom JS loaded - All pages ready.");
 });
 
+// Listing endpoints (/products, /vendors, /api/track-products, ...) return one page per request;
+// follow the X-Next-Cursor header until the last page.
+async function fetchAllPages(url) {
+  const sep = url.includes('?') ? '&' : '?';
+  let rows = [], cursor = null;
+  do {
+    const res = await fetch(url + sep + 'limit=500' + (cursor ? '&cursor=' + encodeURIComponent(cursor) : ''));
+    if (!res.ok) throw new Error(res.status + ' ' + res.statusText);
+    rows = rows.concat(await res.json());
+    cursor = res.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return rows;
+}
+
 function openSetAlert(pid, pname) {
   document.getElementById('alert_product_id').value = pid;
   document.getElementById('alert_product_name').value = pname;